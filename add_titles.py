@@ -1,52 +1,90 @@
-import json
+import argparse
 import os
 import re
+from chapter_titles import load_title_index
+from chapter_pack import open_chapter_source, write_pack, chapter_number, KIND_TXT, PACK_SUFFIX
+from tracing import span, chapter_id
+from atomic_io import atomic_write
 
-def extract_chapter_number(filename):
-    match = re.search(r'chapter_(\d+)\.txt', filename)
-    if match:
-        return int(match.group(1))
-    return None
-
-# Read the info JSON file
-try:
-    with open('output/mục_thần_ký_info.json', 'r', encoding='utf-8') as f:
-        info = json.load(f)
-except Exception as e:
-    print(f"Error reading info.json: {e}")
-    exit(1)
-
-# Create a dictionary mapping chapter numbers to titles
-chapter_titles = {}
-for chapter in info['chapters']:
-    match = re.search(r'Chương (\d+):', chapter['title'])
-    if match:
-        chapter_num = int(match.group(1))
-        chapter_titles[chapter_num] = chapter['title']
-
-# Process each chapter file in the output directory
-txt_dir = 'output/mục_thần_ký_txt'
-for filename in os.listdir(txt_dir):
-    if not filename.startswith('chapter_') or not filename.endswith('.txt'):
-        continue
-    
-    chapter_num = extract_chapter_number(filename)
-    if chapter_num is None:
-        continue
-    
-    filepath = os.path.join(txt_dir, filename)
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Check if the file already has a chapter title
-        if not re.search(r'^#.*Chương \d+:', content, re.MULTILINE):
-            if chapter_num in chapter_titles:
-                # Replace the generic title with the actual chapter title
-                new_content = content.replace('# Mục Thần Ký', f"# {chapter_titles[chapter_num]}")
-                
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(new_content)
-                print(f"Added title to chapter {chapter_num}")
-    except Exception as e:
-        print(f"Error processing {filename}: {e}") 
\ No newline at end of file
+# export_to_txt writes the correct heading in its single pass; this script only
+# fixes txt files whose heading is wrong (e.g. exported before the title index existed)
+
+def read_heading(filepath):
+    """Read only the first line of a chapter file"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return f.readline().rstrip('\n')
+
+def fix_heading(filepath, heading):
+    """Replace the first line of a chapter file with the given heading"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        f.readline()
+        rest = f.read()
+    with atomic_write(filepath) as f:
+        f.write(f"{heading}\n{rest}")
+
+def fix_pack_titles(pack_path, title_index):
+    """fix_titles for a txt pack: the pack is rewritten once if any heading was wrong"""
+    source = open_chapter_source(pack_path, suffix='.txt')
+    chapters = []
+    fixed = 0
+    for filename in source.names():
+        title, text, flags = source.read_chapter(filename)
+        expected_title = title_index.get(filename[:-len('.txt')])
+        heading, _, rest = text.partition('\n')
+        if expected_title and heading != f"# {expected_title}":
+            title, text = expected_title, f"# {expected_title}\n{rest}"
+            fixed += 1
+            print(f"Fixed title of {filename}")
+        chapters.append((chapter_number(filename), title, text, flags))
+    source.close()
+    if fixed:
+        write_pack(pack_path, KIND_TXT, chapters)
+    return fixed
+
+def fix_titles(txt_dir, title_index, novel_title=None):
+    """
+    Fix headings that don't match the title index, returns the number of files changed
+
+    txt_dir may also be a txt .pack built by chapter_pack.py.
+    """
+    if txt_dir.endswith(PACK_SUFFIX):
+        return fix_pack_titles(txt_dir, title_index)
+    fixed = 0
+    for filename in sorted(os.listdir(txt_dir)):
+        if not re.fullmatch(r'chapter_\d+\.txt', filename):
+            continue
+
+        title = title_index.get(filename[:-len('.txt')])
+        if not title:
+            continue
+
+        filepath = os.path.join(txt_dir, filename)
+        expected = f"# {title}"
+        try:
+            if read_heading(filepath) != expected:
+                with span('titles', chapter_id(novel_title, filename)):
+                    fix_heading(filepath, expected)
+                fixed += 1
+                print(f"Fixed title of {filename}")
+        except Exception as e:
+            print(f"Error processing {filename}: {e}")
+    return fixed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fix chapter headings in exported txt files')
+    parser.add_argument('--from-pack', action='store_true', help='Fix output/<novel>_txt.pack instead of the txt directory')
+    args = parser.parse_args()
+
+    novel_title = "mục_thần_ký"
+    base_dir = "output"
+    txt_dir = os.path.join(base_dir, f"{novel_title}_txt")
+    if args.from_pack:
+        txt_dir += PACK_SUFFIX
+
+    title_index = load_title_index(base_dir, novel_title)
+    if not title_index:
+        print(f"Error: no chapter list found for {novel_title} in {base_dir}")
+        exit(1)
+
+    fixed = fix_titles(txt_dir, title_index, novel_title)
+    print(f"Fixed {fixed} chapter titles")
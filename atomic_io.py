@@ -0,0 +1,151 @@
+"""
+Crash-safe output files.
+
+atomic_write() writes to a temporary file next to the destination, fsyncs it
+and renames it over the destination, so after a crash (or a kill mid-write)
+the path holds either the previous file or the complete new one, never a
+truncated one.
+
+CompletionJournal is a write-ahead log of outputs that were written completely:
+one JSON line per output, appended and fsynced after the output's rename. A
+resumed run trusts an output whose stamp (size and mtime, or whatever the
+caller records) still matches its journal entry, without opening it.
+"""
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+JOURNAL_FILE = '.journal.jsonl'
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def fsync_directory(directory):
+    """Makes a rename in the directory durable (no-op where directories can't be opened, e.g. Windows)"""
+    if os.name == 'nt':
+        return
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding='utf-8', newline=None):
+    """
+    Opens a temporary file that replaces path only once the with-block finishes without an exception
+
+    Args:
+        path (str): Destination file (its directory is created if needed)
+        mode (str): 'w' or 'wb'
+        encoding (str): Text encoding, ignored in binary mode
+        newline (str): Passed to open() in text mode (e.g. '' for csv)
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # A unique name per write, so concurrent writers of one path never share a temporary file
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    binary = 'b' in mode
+    try:
+        with open(fd, mode, encoding=None if binary else encoding, newline=None if binary else newline) as f:
+            # mkstemp creates the file 0600; give it the permissions open() would have
+            os.chmod(tmp_path, 0o666 & ~UMASK)
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(directory)
+
+
+def write_json(path, data, indent=4):
+    """json.dump to path through atomic_write"""
+    with atomic_write(path) as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+
+
+def file_stamp(path):
+    """(size, mtime_ns) of a file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class CompletionJournal:
+    """
+    Append-only journal of completed outputs in one directory.
+
+    Each line is [name, stamp]; a later line for a name replaces an earlier
+    one. A torn last line (the process died while appending it) is ignored,
+    so at worst that one output is validated again on the next run.
+    Thread-safe.
+    """
+
+    def __init__(self, directory, filename=JOURNAL_FILE):
+        self.directory = directory
+        self.path = os.path.join(directory, filename)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.lines = 0
+        self._file = None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        name, stamp = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[name] = stamp
+                    self.lines += 1
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_complete(self, name, stamp):
+        """True if name was journaled with this stamp"""
+        return stamp is not None and self.entries.get(name) == stamp
+
+    def record(self, name, stamp):
+        """Journals an output; call after its atomic_write has finished"""
+        line = json.dumps([name, stamp], ensure_ascii=False) + '\n'
+        with self.lock:
+            if self._file is None:
+                os.makedirs(self.directory or '.', exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.entries[name] = stamp
+            self.lines += 1
+
+    def compact(self):
+        """Rewrites the journal with one line per output once superseded lines dominate it"""
+        with self.lock:
+            if self.lines <= 2 * len(self.entries) + 100:
+                return
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with atomic_write(self.path) as f:
+                for name, stamp in self.entries.items():
+                    f.write(json.dumps([name, stamp], ensure_ascii=False) + '\n')
+            self.lines = len(self.entries)
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,141 @@
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+import zipfile
+from chapter_pack import open_chapter_source
+
+DEFAULT_BUNDLE_SIZE = 200
+BUNDLE_MANIFEST = 'bundles.json'
+BUNDLE_FORMATS = ('zip', 'tar.zst')
+# Fixed member timestamp so identical chapters always produce byte-identical archives
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def chapter_number(filename):
+    match = re.search(r'chapter_(\d+)\.txt$', filename)
+    return int(match.group(1)) if match else None
+
+
+def bundle_name(first, last, fmt):
+    return f"chapters_{first:04d}-{last:04d}.{fmt}"
+
+
+def group_chapters(source, bundle_size):
+    """
+    Groups a chapter source's txt chapters into fixed chapter-number ranges.
+
+    Ranges are aligned to the chapter number (1-200, 201-400, ...) rather than
+    to file position, so adding or editing a chapter only changes its own bundle.
+
+    Returns:
+        dict: (first, last) -> sorted list of filenames
+    """
+    groups = {}
+    for filename in source.names():
+        number = chapter_number(filename)
+        if number is None:
+            continue
+        first = (number - 1) // bundle_size * bundle_size + 1
+        groups.setdefault((first, first + bundle_size - 1), []).append(filename)
+    for filenames in groups.values():
+        filenames.sort(key=chapter_number)
+    return groups
+
+
+def members_digest(source, filenames):
+    """Hash over member names and contents, used to decide whether a bundle must be rebuilt."""
+    digest = hashlib.sha1()
+    for filename in filenames:
+        digest.update(filename.encode('utf-8') + b'\0')
+        digest.update(hashlib.md5(source.read_bytes(filename)).digest())
+    return digest.hexdigest()
+
+
+def write_zip(bundle_path, source, filenames):
+    with zipfile.ZipFile(bundle_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        for filename in filenames:
+            info = zipfile.ZipInfo(filename, date_time=ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, bytes(source.read_bytes(filename)))
+
+
+def write_tar_zst(bundle_path, source, filenames):
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("The tar.zst bundle format requires the 'zstandard' package (pip install zstandard)")
+    with open(bundle_path, 'wb') as raw:
+        with zstandard.ZstdCompressor(level=19).stream_writer(raw) as compressed:
+            with tarfile.open(fileobj=compressed, mode='w|') as archive:
+                for filename in filenames:
+                    data = bytes(source.read_bytes(filename))
+                    info = tarfile.TarInfo(filename)
+                    info.size = len(data)
+                    info.mtime = 0
+                    archive.addfile(info, io.BytesIO(data))
+
+
+def build_bundles(txt_dir, bundle_dir, bundle_size=DEFAULT_BUNDLE_SIZE, fmt='zip'):
+    """
+    Packs chapter txt files into compressed archives of `bundle_size` chapters.
+
+    Only bundles whose member chapters changed since the last build are rewritten,
+    so unchanged archives keep their bytes and mtime and are skipped by the sync.
+
+    Args:
+        txt_dir (str): Directory with chapter_XXXX.txt files, or a txt .pack built by chapter_pack.py
+        bundle_dir (str): Directory for archives and the bundle manifest
+        bundle_size (int): Chapters per archive
+        fmt (str): 'zip' or 'tar.zst'
+
+    Returns:
+        list: Paths of all bundle files plus the bundle manifest
+    """
+    if fmt not in BUNDLE_FORMATS:
+        raise ValueError(f"Unknown bundle format '{fmt}', expected one of {BUNDLE_FORMATS}")
+    os.makedirs(bundle_dir, exist_ok=True)
+    manifest_path = os.path.join(bundle_dir, BUNDLE_MANIFEST)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f).get('bundles', {})
+    except FileNotFoundError:
+        previous = {}
+
+    writer = write_zip if fmt == 'zip' else write_tar_zst
+    bundles = {}
+    rebuilt = 0
+    # A pack holds the exported txt files byte for byte, so both layouts give the same bundles
+    source = open_chapter_source(txt_dir, suffix='.txt')
+    for (first, last), filenames in sorted(group_chapters(source, bundle_size).items()):
+        name = bundle_name(first, last, fmt)
+        path = os.path.join(bundle_dir, name)
+        digest = members_digest(source, filenames)
+        if previous.get(name, {}).get('digest') != digest or not os.path.exists(path):
+            tmp_path = path + '.tmp'
+            writer(tmp_path, source, filenames)
+            os.replace(tmp_path, path)
+            rebuilt += 1
+            print(f"Built {name} ({len(filenames)} chapters)")
+        bundles[name] = {
+            'first': first,
+            'last': last,
+            'chapters': [chapter_number(filename) for filename in filenames],
+            'digest': digest,
+        }
+    source.close()
+
+    # Drop archives from a previous build that no longer correspond to any range
+    for name in set(previous) - set(bundles):
+        stale = os.path.join(bundle_dir, name)
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    manifest = {'format': fmt, 'bundle_size': bundle_size, 'bundles': bundles}
+    if previous != bundles:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"{len(bundles)} bundles, {rebuilt} rebuilt")
+    return [os.path.join(bundle_dir, name) for name in sorted(bundles)] + [manifest_path]
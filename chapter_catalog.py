@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Columnar catalogue of every novel's chapters, for questions across novels.
+
+The catalogue is a Parquet dataset partitioned by novel:
+
+    output/catalog/novel=mục_thần_ký/chapters.parquet
+
+with one row per chapter in the novel's chapter list (or per chapter file when
+there is no list): index, title, url, downloaded, chars, tokens (estimated),
+content_hash, extraction, fetched_at (the chapter file's modification time),
+file_bytes and enhanced. Updates are incremental: a chapter file is only
+re-read when its size or modification time differs from its row, so
+refreshing a novel after a scrape reads just the new chapters.
+
+    python chapter_catalog.py build            # refresh every novel under output/
+    python chapter_catalog.py gaps             # novels with chapters not downloaded yet
+    python chapter_catalog.py pending          # tokens still to be enhanced, per novel
+    python chapter_catalog.py stats
+
+Requires pyarrow (pip install pyarrow), imported only when the catalogue is used.
+"""
+import argparse
+import hashlib
+import json
+import os
+from atomic_io import atomic_write
+from chapter_pack import chapter_number
+from enhance_planner import estimate_tokens
+
+CATALOG_DIR = 'output/catalog'
+PARTITION_FILE = 'chapters.parquet'
+# Where each novel's enhanced chapters are written (see OUTPUT_DIR in enhance_chapters.py)
+ENHANCED_DIRS = {'mục_thần_ký': 'enhance_output'}
+COLUMNS = ['index', 'title', 'url', 'downloaded', 'chars', 'tokens', 'content_hash', 'extraction',
+           'fetched_at', 'file_bytes', 'enhanced']
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("The chapter catalogue requires the 'pyarrow' package (pip install pyarrow)")
+    return pyarrow
+
+
+def schema(pa):
+    return pa.schema([
+        ('index', pa.int32()),
+        ('title', pa.string()),
+        ('url', pa.string()),
+        ('downloaded', pa.bool_()),
+        ('chars', pa.int64()),
+        ('tokens', pa.int64()),
+        ('content_hash', pa.string()),
+        ('extraction', pa.string()),
+        ('fetched_at', pa.timestamp('ns')),
+        ('file_bytes', pa.int64()),
+        ('enhanced', pa.bool_()),
+    ])
+
+
+def partition_path(catalog_dir, novel):
+    return os.path.join(catalog_dir, f"novel={novel}", PARTITION_FILE)
+
+
+def chapter_row(index, path, stat):
+    """Catalogue columns read from one chapter JSON file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        chapter_data = json.load(f)
+    text = chapter_data.get('content_text', '')
+    return {
+        'index': index,
+        'title': chapter_data.get('title'),
+        'url': chapter_data.get('url'),
+        'downloaded': True,
+        'chars': len(text),
+        'tokens': estimate_tokens(text),
+        'content_hash': hashlib.sha1(text.encode('utf-8')).hexdigest()[:16],
+        'extraction': chapter_data.get('extraction'),
+        'fetched_at': stat.st_mtime_ns,
+        'file_bytes': stat.st_size,
+    }
+
+
+def update_novel(novel, output_dir='output', catalog_dir=CATALOG_DIR, enhanced_dir=None):
+    """
+    Brings one novel's partition up to date with its chapter files
+
+    Args:
+        novel (str): Novel file name prefix, e.g. 'mục_thần_ký'
+        output_dir (str): Directory holding <novel>_info.json and <novel>_chapters/
+        catalog_dir (str): Root of the catalogue dataset
+        enhanced_dir (str): Directory of the novel's enhanced chapters (default: ENHANCED_DIRS)
+
+    Returns:
+        tuple: (rows in the partition, chapter files read)
+    """
+    pa = _arrow()
+    path = partition_path(catalog_dir, novel)
+    previous = {}
+    if os.path.exists(path):
+        table = pa.parquet.read_table(path)
+        # As integer nanoseconds, to compare with st_mtime_ns (datetimes only keep microseconds)
+        table = table.set_column(table.schema.get_field_index('fetched_at'), 'fetched_at', table['fetched_at'].cast(pa.int64()))
+        for row in table.to_pylist():
+            previous[row['index']] = row
+
+    # Rows for every listed chapter, so chapters not downloaded yet show up as gaps
+    rows = {}
+    try:
+        with open(os.path.join(output_dir, f"{novel}_info.json"), 'r', encoding='utf-8') as f:
+            listed = json.load(f).get('chapters', [])
+    except FileNotFoundError:
+        listed = []
+    for i, chapter in enumerate(listed):
+        rows[i + 1] = {'index': i + 1, 'title': chapter.get('title'), 'url': chapter.get('url'), 'downloaded': False}
+
+    read = 0
+    chapters_dir = os.path.join(output_dir, f"{novel}_chapters")
+    if os.path.isdir(chapters_dir):
+        for entry in os.scandir(chapters_dir):
+            index = chapter_number(entry.name)
+            if index is None or not entry.name.endswith('.json'):
+                continue
+            stat = entry.stat()
+            row = previous.get(index)
+            if row is None or not row['downloaded'] or [row['file_bytes'], row['fetched_at']] != [stat.st_size, stat.st_mtime_ns]:
+                try:
+                    row = chapter_row(index, entry.path, stat)
+                except ValueError:
+                    continue # Truncated file: left to verify_chapters.py
+                read += 1
+            rows[index] = {**rows.get(index, {}), **row}
+
+    # Enhancement status is cheap to recompute: one directory listing
+    enhanced_dir = enhanced_dir or ENHANCED_DIRS.get(novel)
+    enhanced = set()
+    if enhanced_dir and os.path.isdir(enhanced_dir):
+        enhanced = {chapter_number(name) for name in os.listdir(enhanced_dir) if name.endswith('.txt')}
+    for index, row in rows.items():
+        row['enhanced'] = index in enhanced
+
+    table = pa.Table.from_pylist([{column: rows[index].get(column) for column in COLUMNS} for index in sorted(rows)],
+                                 schema=schema(pa))
+    with atomic_write(path, 'wb') as f:
+        pa.parquet.write_table(table, f)
+    return len(rows), read
+
+
+def novels_in(output_dir):
+    return sorted(name[:-len('_chapters')] for name in os.listdir(output_dir)
+                  if name.endswith('_chapters') and os.path.isdir(os.path.join(output_dir, name)))
+
+
+def load_catalog(catalog_dir=CATALOG_DIR):
+    """The whole catalogue as one Arrow table, with the novel column taken from the partition paths"""
+    pa = _arrow()
+    return pa.dataset.dataset(catalog_dir, format='parquet', partitioning='hive').to_table()
+
+
+def gaps(table, examples=10):
+    """novel -> (listed chapters, missing chapter count, first missing indices) for novels with gaps"""
+    pa = _arrow()
+    counts = table.group_by('novel').aggregate([('index', 'count')])
+    totals = dict(zip(counts['novel'].to_pylist(), counts['index_count'].to_pylist()))
+    missing = (table.filter(pa.compute.invert(table['downloaded'])).select(['novel', 'index'])
+               .sort_by([('novel', 'ascending'), ('index', 'ascending')]))
+    result = {}
+    for novel, index in zip(missing['novel'].to_pylist(), missing['index'].to_pylist()):
+        entry = result.setdefault(novel, [totals[novel], 0, []])
+        entry[1] += 1
+        if len(entry[2]) < examples:
+            entry[2].append(index)
+    return {novel: tuple(entry) for novel, entry in result.items()}
+
+
+def pending(table):
+    """novel -> (chapters downloaded but not enhanced, their estimated tokens)"""
+    pa = _arrow()
+    pc = pa.compute
+    todo = table.filter(pc.and_(table['downloaded'], pc.invert(table['enhanced'])))
+    summary = todo.group_by('novel').aggregate([('index', 'count'), ('tokens', 'sum')])
+    return {novel: (count, tokens or 0) for novel, count, tokens in
+            zip(summary['novel'].to_pylist(), summary['index_count'].to_pylist(), summary['tokens_sum'].to_pylist())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the columnar chapter catalogue')
+    parser.add_argument('--catalog', default=CATALOG_DIR, help=f'Catalogue directory (default: {CATALOG_DIR})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Update the catalogue from the chapter files (incremental)')
+    build_parser.add_argument('--output', default='output', help='Scraper output directory (default: output)')
+    build_parser.add_argument('--novel', action='append', help='Only this novel (repeatable)')
+    build_parser.add_argument('--enhanced', action='append', metavar='NOVEL=DIR', default=[],
+                              help='Enhanced chapter directory of a novel (default: enhance_output for mục_thần_ký)')
+    subparsers.add_parser('gaps', help='Novels with listed chapters that are not downloaded')
+    subparsers.add_parser('pending', help='Downloaded chapters not enhanced yet, and their estimated tokens')
+    subparsers.add_parser('stats', help='Chapters, characters and tokens per novel')
+    args = parser.parse_args()
+
+    try:
+        _arrow()
+    except RuntimeError as e:
+        print(e)
+        return
+
+    if args.command == 'build':
+        enhanced_dirs = dict(item.split('=', 1) for item in args.enhanced)
+        for novel in args.novel or novels_in(args.output):
+            rows, read = update_novel(novel, args.output, args.catalog, enhanced_dirs.get(novel))
+            print(f"{novel}: {rows} chapters, {read} chapter files read")
+        return
+
+    if not os.path.isdir(args.catalog):
+        print(f"No catalogue at {args.catalog}, run: python chapter_catalog.py build")
+        return
+    table = load_catalog(args.catalog)
+
+    if args.command == 'gaps':
+        found = gaps(table)
+        for novel, (listed, missing, first) in found.items():
+            print(f"{novel}: {missing}/{listed} chapters not downloaded (first: {', '.join(map(str, first))})")
+        print(f"{len(found)} novels with gaps")
+    elif args.command == 'pending':
+        found = pending(table)
+        for novel, (count, tokens) in sorted(found.items(), key=lambda item: -item[1][1]):
+            print(f"{novel}: {count} chapters, ~{tokens:,} tokens")
+        print(f"Total: {sum(count for count, _ in found.values())} chapters, ~{sum(tokens for _, tokens in found.values()):,} tokens pending enhancement")
+    else:
+        pa = _arrow()
+        # Whole seconds are enough to show, and convert to datetime without pandas
+        table = table.set_column(table.schema.get_field_index('fetched_at'), 'fetched_at',
+                                 pa.compute.cast(table['fetched_at'], pa.timestamp('s'), safe=False))
+        summary = table.group_by('novel').aggregate([('index', 'count'), ('downloaded', 'sum'), ('enhanced', 'sum'),
+                                                     ('chars', 'sum'), ('tokens', 'sum'), ('fetched_at', 'max')])
+        print(f"{'novel':<30}{'chapters':>10}{'downloaded':>12}{'enhanced':>10}{'chars':>14}{'tokens':>12}  last fetch")
+        for row in summary.to_pylist():
+            print(f"{row['novel']:<30}{row['index_count']:>10}{row['downloaded_sum'] or 0:>12}{row['enhanced_sum'] or 0:>10}"
+                  f"{row['chars_sum'] or 0:>14,}{row['tokens_sum'] or 0:>12,}  {row['fetched_at_max'] or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from chapter_pack import open_chapter_source
+
+FINGERPRINT_CACHE = '.fingerprints.json'
+FINGERPRINT_VERSION = 2
+SHINGLE_SIZE = 3 # Words per shingle
+SIMHASH_BITS = 64
+# Chapters whose SimHashes differ in at most this many bits are near-duplicates
+# (a few dozen edited words in a 5,000-word chapter moves ~6 bits; unrelated chapters ~32).
+# With 8 bands of 8 bits, any pair within 7 bits shares at least one band exactly.
+NEAR_DUPLICATE_DISTANCE = 6
+BANDS = 8
+MIN_WORDS = 50 # Very short texts (e.g. notices) are only compared exactly
+
+
+def chapter_text(source, name):
+    """Chapter body: content_text for JSON chapters, the txt file without its heading line"""
+    _, text, _ = source.read_chapter(name)
+    if name.endswith('.txt') and text.startswith('#'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+    return text
+
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', text.lower()).strip()
+
+
+def simhash(words):
+    """64-bit SimHash over word shingles"""
+    shingles = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))]
+    digests = b''.join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest() for shingle in shingles)
+    # Count set bits per position a byte column at a time instead of bit by bit per shingle
+    value = 0
+    for position in range(SIMHASH_BITS // 8):
+        ones = [0] * 8
+        for byte, count in Counter(digests[position::8]).items():
+            for bit in range(8):
+                if byte >> bit & 1:
+                    ones[bit] += count
+        for bit in range(8):
+            if ones[bit] * 2 > len(shingles):
+                value |= 1 << (position * 8 + bit)
+    return value
+
+
+def fingerprint(source, name):
+    text = normalize(chapter_text(source, name))
+    words = text.split()
+    return {
+        'exact': hashlib.sha1(text.encode('utf-8')).hexdigest(),
+        'simhash': simhash(words) if len(words) >= MIN_WORDS else None,
+        'bytes': len(text.encode('utf-8')),
+    }
+
+
+def build_fingerprint_index(source):
+    """
+    Fingerprints every chapter in a chapter source (directory or pack, see chapter_pack.py)
+
+    Fingerprints are cached next to the chapters and reused while a chapter's stamp is unchanged.
+
+    Returns:
+        dict: chapter name -> {'exact', 'simhash', 'bytes'}, in chapter order
+    """
+    cache_path = source.cache_path(FINGERPRINT_CACHE)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = {}
+    if cache.get('version') != FINGERPRINT_VERSION:
+        cache = {'version': FINGERPRINT_VERSION, 'files': {}}
+
+    index = {}
+    for name in source.names():
+        stamp = list(source.stamp(name))
+        entry = cache['files'].get(name)
+        if not entry or entry['stamp'] != stamp:
+            entry = fingerprint(source, name)
+            entry['stamp'] = stamp
+            cache['files'][name] = entry
+        index[name] = entry
+
+    cache['files'] = {name: cache['files'][name] for name in index}
+    try:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"Warning: could not save fingerprint cache {cache_path}: {e}")
+    return index
+
+
+def find_duplicates(index):
+    """
+    Finds exact and near-duplicate chapters; the earliest chapter is kept as the original
+
+    Returns:
+        dict: duplicate filename -> {'original', 'kind' ('exact' or 'near'), 'distance'}
+    """
+    duplicates = {}
+    by_exact = {}
+    bands = [{} for _ in range(BANDS)]
+    band_bits = SIMHASH_BITS // BANDS
+    band_mask = (1 << band_bits) - 1
+
+    for filename, entry in index.items():
+        if entry['bytes'] == 0:
+            continue # Empty chapters are a scraping problem, not duplicates (see verify_chapters.py)
+        original = by_exact.get(entry['exact'])
+        if original:
+            duplicates[filename] = {'original': original, 'kind': 'exact', 'distance': 0}
+            continue
+        by_exact[entry['exact']] = filename
+
+        value = entry['simhash']
+        if value is None:
+            continue
+        best = None
+        for band in range(BANDS):
+            key = value >> (band * band_bits) & band_mask
+            for candidate in bands[band].get(key, []):
+                distance = bin(value ^ index[candidate]['simhash']).count('1')
+                if distance <= NEAR_DUPLICATE_DISTANCE and (best is None or distance < best[1]):
+                    best = (candidate, distance)
+        if best:
+            duplicates[filename] = {'original': best[0], 'kind': 'near', 'distance': best[1]}
+            continue
+        for band in range(BANDS):
+            bands[band].setdefault(value >> (band * band_bits) & band_mask, []).append(filename)
+
+    return duplicates
+
+
+def print_duplicate_report(index, duplicates):
+    saved_bytes = sum(index[filename]['bytes'] for filename in duplicates)
+    for filename, dup in duplicates.items():
+        detail = '' if dup['kind'] == 'exact' else f" (distance {dup['distance']})"
+        print(f"  {filename}: {dup['kind']} duplicate of {dup['original']}{detail}")
+    exact = sum(1 for dup in duplicates.values() if dup['kind'] == 'exact')
+    print(f"Duplicates: {len(duplicates)} of {len(index)} chapters ({exact} exact, {len(duplicates) - exact} near)")
+    print(f"Skipping them saves {len(duplicates)} LLM calls and {saved_bytes:,} bytes of chapter text")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find duplicate and near-duplicate chapters')
+    parser.add_argument('chapters_dir', nargs='?', default='output/mục_thần_ký_chapters', help='Directory of chapter .json or .txt files, or a .pack file')
+    args = parser.parse_args()
+
+    suffix = '.json'
+    if os.path.isdir(args.chapters_dir) and any(f.endswith('.txt') for f in os.listdir(args.chapters_dir)):
+        suffix = '.txt'
+    source = open_chapter_source(args.chapters_dir, suffix)
+    index = build_fingerprint_index(source)
+    print_duplicate_report(index, find_duplicates(index))
+    source.close()
+
+
+if __name__ == '__main__':
+    main()
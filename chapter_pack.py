@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Packed chapter corpus: all of a novel's chapters in one file.
+
+Layout (little-endian):
+
+    header   32 bytes   magic 'CHPK', version u16, kind u16, count u32, table offset u64, padding
+    data     ...        UTF-8 title and text bytes of every chapter, back to back
+    table    count * 36 bytes, one fixed-width entry per chapter, sorted by chapter number:
+             number u32, title offset u64, title length u32, text offset u64, text length u32,
+             crc32 of text u32, flags u32
+
+The reader mmaps the file and hands out memoryview slices of the data region,
+so looking up a chapter costs no open() calls and no copies until decoding.
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+
+MAGIC = b'CHPK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIQ')
+HEADER_SIZE = 32
+ENTRY = struct.Struct('<IQIQIII')
+PACK_SUFFIX = '.pack'
+
+# What the text of each entry holds: chapter JSON content_text, or a whole exported txt file
+KIND_JSON = 0
+KIND_TXT = 1
+KIND_SUFFIX = {KIND_JSON: '.json', KIND_TXT: '.txt'}
+
+FLAG_FALLBACK = 1 # Content came from the fallback extraction (see verify_chapters.py)
+
+CHAPTER_FILE = re.compile(r'chapter_(\d+)\.(json|txt)$')
+
+
+def chapter_number(filename):
+    match = CHAPTER_FILE.search(filename)
+    return int(match.group(1)) if match else None
+
+
+def write_pack(pack_path, kind, chapters):
+    """
+    Writes a pack file
+
+    Args:
+        pack_path (str): Destination path
+        kind (int): KIND_JSON or KIND_TXT
+        chapters (iterable): (number, title, text, flags) tuples
+
+    Returns:
+        int: Number of chapters written
+    """
+    entries = []
+    tmp_path = pack_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * HEADER_SIZE)
+        offset = HEADER_SIZE
+        for number, title, text, flags in sorted(chapters, key=lambda chapter: chapter[0]):
+            title_bytes = (title or '').encode('utf-8')
+            text_bytes = (text or '').encode('utf-8')
+            f.write(title_bytes)
+            f.write(text_bytes)
+            entries.append((number, offset, len(title_bytes), offset + len(title_bytes), len(text_bytes),
+                            zlib.crc32(text_bytes), flags))
+            offset += len(title_bytes) + len(text_bytes)
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, kind, len(entries), offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pack_path)
+    return len(entries)
+
+
+def read_directory_chapter(filepath):
+    """(title, text, flags) for a chapter JSON or txt file, in the form stored in a pack"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        if filepath.endswith('.json'):
+            chapter_data = json.load(f)
+            flags = FLAG_FALLBACK if chapter_data.get('extraction') == 'fallback' else 0
+            return chapter_data.get('title', ''), chapter_data.get('content_text', ''), flags
+        text = f.read()
+    title = text.split('\n', 1)[0].lstrip('# ').strip() if text.startswith('#') else ''
+    return title, text, 0
+
+
+def pack_directory(chapters_dir, pack_path):
+    """Packs every chapter_XXXX.json (or .txt) file in a directory into one pack file"""
+    filenames = [f for f in os.listdir(chapters_dir) if chapter_number(f) is not None]
+    kind = KIND_TXT if any(f.endswith('.txt') for f in filenames) else KIND_JSON
+    suffix = KIND_SUFFIX[kind]
+
+    def chapters():
+        for filename in filenames:
+            if filename.endswith(suffix):
+                yield (chapter_number(filename),) + read_directory_chapter(os.path.join(chapters_dir, filename))
+
+    count = write_pack(pack_path, kind, chapters())
+    print(f"Packed {count} chapters from {chapters_dir} into {pack_path}")
+    return count
+
+
+class ChapterPack:
+    """Read-only, memory-mapped view of a pack file"""
+
+    def __init__(self, pack_path):
+        self.path = pack_path
+        self._view = self._mmap = None
+        self._file = open(pack_path, 'rb')
+        try:
+            # mmap can't map an empty file; too short for a header is reported below instead
+            size = os.fstat(self._file.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise ValueError(f"{pack_path} is truncated: {size} bytes, shorter than the pack header")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+            magic, version, self.kind, count, table_offset = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{pack_path} is not a version {VERSION} chapter pack")
+            table_end = table_offset + count * ENTRY.size
+            if table_offset < HEADER_SIZE or table_end > len(self._mmap):
+                raise ValueError(f"{pack_path} is truncated: its offset table ends at byte {table_end} of {len(self._mmap)}")
+            table = self._view[table_offset:table_end]
+            self.entries = {entry[0]: entry for entry in ENTRY.iter_unpack(table)}
+            table.release()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """Unmaps the pack. Slices from text_bytes/title_bytes must be dropped first."""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def numbers(self):
+        return sorted(self.entries)
+
+    def title_bytes(self, number):
+        _, title_offset, title_length, _, _, _, _ = self.entries[number]
+        return self._view[title_offset:title_offset + title_length]
+
+    def text_bytes(self, number):
+        """Zero-copy memoryview of a chapter's text"""
+        _, _, _, text_offset, text_length, _, _ = self.entries[number]
+        return self._view[text_offset:text_offset + text_length]
+
+    def title(self, number):
+        return str(self.title_bytes(number), 'utf-8')
+
+    def text(self, number):
+        return str(self.text_bytes(number), 'utf-8')
+
+    def flags(self, number):
+        return self.entries[number][6]
+
+    def iter_chapters(self):
+        """Yields (number, title, text) in file order, reading the pack front to back once"""
+        if hasattr(self._mmap, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        for number in sorted(self.entries, key=lambda n: self.entries[n][1]):
+            yield number, self.title(number), self.text(number)
+
+
+class DirectorySource:
+    """Chapters stored as one file per chapter (the default layout)"""
+
+    def __init__(self, directory, suffix):
+        self.directory = directory
+        self.suffix = suffix
+
+    def names(self):
+        return sorted(f for f in os.listdir(self.directory) if f.startswith('chapter_') and f.endswith(self.suffix))
+
+    def read_chapter(self, name):
+        """(title, text, flags); text is content_text for JSON chapters, the whole file for txt"""
+        return read_directory_chapter(os.path.join(self.directory, name))
+
+    def read_bytes(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def stamp(self, name):
+        """Cheap change marker used by caches: (size, mtime)"""
+        stat = os.stat(os.path.join(self.directory, name))
+        return stat.st_size, stat.st_mtime_ns
+
+    def cache_path(self, cache_name):
+        return os.path.join(self.directory, cache_name)
+
+    def close(self):
+        pass
+
+
+class PackSource:
+    """Chapters read from a pack file, exposed under the same chapter_XXXX names as the directory layout"""
+
+    def __init__(self, pack_path):
+        self.pack = ChapterPack(pack_path)
+        self.suffix = KIND_SUFFIX[self.pack.kind]
+
+    def _number(self, name):
+        return chapter_number(name)
+
+    def names(self):
+        return [f"chapter_{number:04d}{self.suffix}" for number in self.pack.numbers()]
+
+    def read_chapter(self, name):
+        number = self._number(name)
+        return self.pack.title(number), self.pack.text(number), self.pack.flags(number)
+
+    def read_bytes(self, name):
+        return self.pack.text_bytes(self._number(name))
+
+    def stamp(self, name):
+        """(length, crc32) from the offset table, no data read needed"""
+        entry = self.pack.entries[self._number(name)]
+        return entry[4], entry[5]
+
+    def cache_path(self, cache_name):
+        return f"{self.pack.path}{cache_name}"
+
+    def close(self):
+        self.pack.close()
+
+
+def open_chapter_source(path, suffix='.json'):
+    """Opens a chapter directory or a .pack file behind the same interface"""
+    if os.path.isfile(path) and path.endswith(PACK_SUFFIX):
+        return PackSource(path)
+    return DirectorySource(path, suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or inspect packed chapter files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Pack a chapter directory (JSON or txt) into one file')
+    build.add_argument('chapters_dir')
+    build.add_argument('pack_path', nargs='?', help='Default: <chapters_dir>.pack')
+    info = subparsers.add_parser('info', help='Show what a pack contains')
+    info.add_argument('pack_path')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        pack_directory(args.chapters_dir, args.pack_path or args.chapters_dir.rstrip('/') + PACK_SUFFIX)
+    else:
+        with ChapterPack(args.pack_path) as pack:
+            numbers = pack.numbers()
+            kind = 'txt' if pack.kind == KIND_TXT else 'json'
+            span = f", chapters {numbers[0]}-{numbers[-1]}" if numbers else ''
+            print(f"{args.pack_path}: {len(pack)} {kind} chapters{span}, {os.path.getsize(args.pack_path):,} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,82 +4,101 @@ import json
 import os
 import time
 import random
-from urllib.parse import urljoin
+import re
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from proxy_pool import EgressError
+from site_profiles import site_of, extract, learned_selectors
+from fetch_cache import page_cache, normalize_url
+from atomic_io import atomic_write, file_stamp, CompletionJournal
+from tracing import span, chapter_id
 
-def scrape_chapter_content(url, base_url="https://wikidich.vn"):
+def fetch_chapter_html(url, base_url="https://wikidich.vn", pool=None):
     """
-    Scrape content from a chapter page
+    Fetch a chapter page without parsing it
     
     Args:
         url (str): URL of the chapter page
         base_url (str): Base URL of the website
+        pool (EgressPool): If given, the request goes through the pool, which does the rate limiting
         
     Returns:
-        dict: Chapter information and content
+        tuple: (absolute URL, raw HTML bytes, encoding from the response headers), or None on failure
     """
-    if not url.startswith('http'):
-        url = urljoin(base_url, url)
+    url = normalize_url(url, base_url)
     
     print(f"Scraping chapter: {url}")
     
-    # Random delay to avoid rate limiting
-    time.sleep(random.uniform(1, 3))
-    
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
     
-    try:
+    def get(url):
+        if pool is not None:
+            return pool.get(url, headers=headers)
+        # Random delay to avoid rate limiting (skipped when the page is already cached)
+        time.sleep(random.uniform(1, 3))
         response = requests.get(url, headers=headers)
         response.raise_for_status()
-    except requests.exceptions.RequestException as e:
+        return response
+    
+    # A page requested twice in one run (e.g. a chapter listed under a relative and an
+    # absolute URL) is only downloaded once; concurrent requests for it share one fetch
+    try:
+        response = page_cache.get(url, get, base_url)
+    except (requests.exceptions.RequestException, EgressError) as e:
         print(f"Error fetching chapter: {e}")
         return None
     
-    soup = BeautifulSoup(response.text, 'html.parser')
+    return url, response.content, response.encoding
+
+def parse_chapter_html(html, url, encoding=None, selectors=None):
+    """
+    Extract title and content from a chapter page
+    
+    Pure CPU work on the raw page, so it can run in a worker process (see scrape_all_chapters).
+    
+    Args:
+        html (bytes): Raw page as fetched
+        url (str): Absolute URL of the page (selects the site profile)
+        encoding (str): Encoding from the response headers, if any
+        selectors (dict): For a worker process: the parent's learned selectors (field -> selector),
+            replaced by the winning selector of each field instead of learning it here (a worker
+            must not write the shared selector file, and its own copy of it goes stale)
+        
+    Returns:
+        dict: Chapter information and content
+    """
+    soup = BeautifulSoup(html, 'html.parser', from_encoding=encoding)
     
     # Extract chapter data
     chapter_data = {}
     
-    # Title - try different possibilities
-    title_candidates = [
-        soup.find('h1', class_='chapter-title'),
-        soup.find('h1'),
-        soup.find('h2', class_='chapter-title'),
-        soup.find('h2')
-    ]
-    
-    for title_element in title_candidates:
-        if title_element and title_element.text.strip():
-            chapter_data['title'] = title_element.text.strip()
-            break
-    else:
-        chapter_data['title'] = "Unknown Chapter"
-    
-    # Content - try different content containers
-    content_candidates = [
-        soup.find('div', class_='chapter-content'),
-        soup.find('div', class_='entry-content'),
-        soup.find('div', class_='content'),
-        soup.find('div', class_='truyen'),
-        soup.find('article'),
-        soup.find('main')
-    ]
-    
-    content_element = None
-    for candidate in content_candidates:
-        if candidate and len(candidate.get_text(strip=True)) > 100:  # Must have significant text
-            content_element = candidate
-            break
-    
-    if content_element:
+    # Title and content come from the site's learned selectors (one lookup each),
+    # falling back to the rest of the site profile only when those fail
+    site = site_of(url)
+    profile = learned_selectors.profile(site)
+    
+    _, title = extract(soup, site, 'title', lambda element: element.text.strip() or None, winners=selectors)
+    chapter_data['title'] = title or "Unknown Chapter"
+    
+    def read_content(element):
+        if len(element.get_text(strip=True)) <= profile['min_content_chars']:  # Must have significant text
+            return None
         # Clean up the content, removing unnecessary elements
-        for element in content_element.find_all(['script', 'style', 'ins', 'iframe', 'ads']):
-            element.decompose()
-            
+        for junk in element.find_all(profile['strip']):
+            junk.decompose()
+        return element, element.get_text(separator='\n\n', strip=True)
+    
+    _, content = extract(soup, site, 'content', read_content, winners=selectors)
+    
+    if content:
+        content_element, content_text = content
+        
         # Get content as HTML and text
         chapter_data['content_html'] = content_element.prettify()
-        chapter_data['content_text'] = content_element.get_text(separator='\n\n', strip=True)
+        chapter_data['content_text'] = content_text
+        chapter_data['extraction'] = 'container'
         
         # Print a preview
         content_preview = chapter_data['content_text'][:150] + "..." if len(chapter_data['content_text']) > 150 else chapter_data['content_text']
@@ -94,15 +113,97 @@ def scrape_chapter_content(url, base_url="https://wikidich.vn"):
             main_content = '\n'.join(lines[int(len(lines)*0.2):int(len(lines)*0.8)])  # Middle 60%
             chapter_data['content_html'] = f"<div>{main_content}</div>"
             chapter_data['content_text'] = main_content
+            chapter_data['extraction'] = 'fallback'
             print(f"Using fallback content extraction method")
         else:
             chapter_data['content_html'] = ""
             chapter_data['content_text'] = ""
+            chapter_data['extraction'] = 'none'
             print(f"Could not extract content")
     
     return chapter_data
 
-def scrape_all_chapters(novel_data, specific_chapters=None, output_dir="output", delay=2.0):
+def traced_fetch(url, chapter, base_url="https://wikidich.vn", pool=None):
+    """fetch_chapter_html, recorded as a 'fetch' span of the chapter"""
+    with span('fetch', chapter) as fetch_span:
+        page = fetch_chapter_html(url, base_url, pool)
+        if page is None:
+            fetch_span['outcome'] = 'failed'
+        else:
+            fetch_span['bytes'] = len(page[1])
+        return page
+
+def traced_parse(html, url, encoding, chapter, selectors=None):
+    """parse_chapter_html, recorded as a 'parse' span of the chapter (in whichever process parses it)"""
+    with span('parse', chapter, bytes=len(html)) as parse_span:
+        chapter_data = parse_chapter_html(html, url, encoding, selectors)
+        parse_span['extraction'] = chapter_data.get('extraction')
+        return chapter_data
+
+def parse_in_worker(html, url, encoding, chapter, learned):
+    """
+    traced_parse for a worker process, using the parent's learned selectors (field -> selector)
+    
+    Returns:
+        tuple: (chapter data, field -> winning selector) for the parent to learn
+    """
+    selectors = dict(learned)
+    chapter_data = traced_parse(html, url, encoding, chapter, selectors)
+    return chapter_data, selectors
+
+def scrape_chapter_content(url, base_url="https://wikidich.vn", pool=None, chapter=None):
+    """
+    Scrape content from a chapter page
+    
+    Args:
+        url (str): URL of the chapter page
+        base_url (str): Base URL of the website
+        pool (EgressPool): If given, the request goes through the pool, which does the rate limiting
+        chapter (str): Chapter ID for the trace (see tracing.chapter_id), defaults to the URL
+        
+    Returns:
+        dict: Chapter information and content
+    """
+    page = traced_fetch(url, chapter or url, base_url, pool)
+    if page is None:
+        return None
+    url, html, encoding = page
+    return traced_parse(html, url, encoding, chapter or url)
+
+def fetch_and_parse(url, pool, parser_pool, chapter=None):
+    """
+    Fetch on the calling thread, parse in the parser process pool; the thread holds one page at a time
+    
+    Workers only report which selectors won; they are learned here, in the process that owns
+    output/site_selectors.json, so parallel workers never write it at the same time.
+    """
+    page = traced_fetch(url, chapter or url, pool=pool)
+    if page is None:
+        return None
+    url, html, encoding = page
+    site = site_of(url)
+    # Sent with every page: a worker's own copy of the selector file is only read once
+    learned = {field: learned_selectors.get(site, field) for field in ('title', 'content')}
+    chapter_data, selectors = parser_pool.submit(parse_in_worker, html, url, encoding, chapter or url, learned).result()
+    for field, selector in selectors.items():
+        learned_selectors.observe(site, field, selector)
+    return chapter_data
+
+def novel_slug(novel_data):
+    """Novel title as used in output file names, e.g. 'mục_thần_ký'"""
+    # Titles come from the page heading, so drop characters that can't appear in a file name
+    return re.sub(r'[\\/:*?"<>|]', '', novel_data.get('title', 'unknown')).replace(' ', '_').lower()
+
+def get_chapters_dir(novel_data, output_dir="output"):
+    """Directory where a novel's chapter JSON files are stored"""
+    return os.path.join(output_dir, f"{novel_slug(novel_data)}_chapters")
+
+def chapter_filename(chapter_index):
+    """File name for the chapter at a 0-based position in the chapter list"""
+    return f"chapter_{chapter_index+1:04d}.json"
+
+def scrape_all_chapters(novel_data, specific_chapters=None, output_dir="output", delay=2.0, search_index=None,
+                        pool=None, jobs=1, parse_workers=None):
     """
     Scrape content for chapters in a novel
     
@@ -110,10 +211,14 @@ def scrape_all_chapters(novel_data, specific_chapters=None, output_dir="output",
         novel_data (dict): Novel information with chapters
         specific_chapters (list): Specific chapters to scrape (if None, uses novel_data['chapters'])
         output_dir (str): Directory to save chapter content
-        delay (float): Delay between chapter requests
+        delay (float): Delay between chapter requests (only without a pool)
+        search_index (SearchIndex): If given, each newly saved chapter is added to the full-text index
+        pool (EgressPool): Fetch through this egress pool instead of directly
+        jobs (int): Chapters fetched concurrently when a pool is given
+        parse_workers (int): Processes parsing fetched pages when jobs > 1 (default: one per CPU, 0 parses on the fetch threads)
         
     Returns:
-        list: Updated chapters with content
+        list: Updated chapters, with content for the chapters fetched in this run (see load_saved_chapters)
     """
     if not novel_data or 'chapters' not in novel_data:
         print("No chapters to scrape")
@@ -127,8 +232,7 @@ def scrape_all_chapters(novel_data, specific_chapters=None, output_dir="output",
         return novel_data['chapters']
     
     # Create chapters directory
-    novel_title = novel_data.get('title', 'unknown').replace(' ', '_').lower()
-    chapters_dir = os.path.join(output_dir, f"{novel_title}_chapters")
+    chapters_dir = get_chapters_dir(novel_data, output_dir)
     
     if not os.path.exists(chapters_dir):
         os.makedirs(chapters_dir)
@@ -139,59 +243,149 @@ def scrape_all_chapters(novel_data, specific_chapters=None, output_dir="output",
     # Map the specific chapters back to their indices in the full chapters list
     chapter_indices = {}
     if specific_chapters is not None:
+        first_index = {}
+        for i, full_chapter in enumerate(novel_data['chapters']):
+            first_index.setdefault(full_chapter['url'], i)
         for chapter in specific_chapters:
-            for i, full_chapter in enumerate(novel_data['chapters']):
-                if chapter['url'] == full_chapter['url']:
-                    chapter_indices[chapter['url']] = i
-                    break
+            if chapter['url'] in first_index:
+                chapter_indices[chapter['url']] = first_index[chapter['url']]
     
-    # Scrape each chapter
-    for i, chapter in enumerate(chapters_to_scrape):
-        print(f"Scraping chapter {i+1}/{total_chapters}: {chapter['title']}")
+    def trace_id(chapter_index):
+        return chapter_id(novel_slug(novel_data), chapter_filename(chapter_index))
+    
+    def save_chapter(chapter, chapter_index, chapter_data):
+        filename = chapter_filename(chapter_index)
+        if not chapter_data:
+            print(f"  Failed to scrape chapter {filename}")
+            return
         
-        # Check if chapter JSON already exists
-        chapter_index = chapter_indices.get(chapter['url'], i)
-        chapter_filename = f"chapter_{chapter_index+1:04d}.json"
-        chapter_path = os.path.join(chapters_dir, chapter_filename)
+        # Create full chapter data by combining the original chapter data with the content
+        full_chapter_data = {**chapter, **chapter_data}
         
-        if os.path.exists(chapter_path):
-            print(f"  Chapter already exists: {chapter_filename}, skipping...")
+        # Save to file: written in full or not at all, then journaled as complete
+        with span('save', chapter_id(novel_slug(novel_data), filename)) as save_span:
+            chapter_path = os.path.join(chapters_dir, filename)
+            with atomic_write(chapter_path) as f:
+                json.dump(full_chapter_data, f, ensure_ascii=False, indent=4)
+            journal.record(filename, file_stamp(chapter_path))
             
-            # Load existing chapter data
-            with open(chapter_path, 'r', encoding='utf-8') as f:
-                chapter_data = json.load(f)
-                
-            # Update the corresponding chapter in novel_data
-            if chapter['url'] in chapter_indices:
-                novel_data['chapters'][chapter_indices[chapter['url']]].update(chapter_data)
+            print(f"  Saved to {filename}")
             
-            continue
+            if search_index is not None:
+                search_index.add_chapter(novel_slug(novel_data), chapter_index + 1,
+                                         full_chapter_data.get('title', ''), full_chapter_data.get('content_text', ''))
+                search_index.commit()
+            save_span['bytes'] = len(full_chapter_data.get('content_text', '').encode('utf-8'))
+        
+        # Update the corresponding chapter in novel_data
+        if chapter['url'] in chapter_indices:
+            novel_data['chapters'][chapter_indices[chapter['url']]].update(chapter_data)
+    
+    # Skip chapters that are already complete, collect the rest. A chapter whose file still
+    # matches its journal entry is trusted without opening it, so resuming a long job costs
+    # one directory listing; only files the journal doesn't vouch for (written before the
+    # journal existed, or changed since) are read once to check they are whole.
+    journal = CompletionJournal(chapters_dir)
+    on_disk = {entry.name: entry for entry in os.scandir(chapters_dir)}
+    pending = []
+    resumed = 0
+    for i, chapter in enumerate(chapters_to_scrape):
+        chapter_index = chapter_indices.get(chapter['url'], i)
+        filename = chapter_filename(chapter_index)
+        entry = on_disk.get(filename)
+        
+        if entry is not None:
+            stat = entry.stat()
+            stamp = [stat.st_size, stat.st_mtime_ns]
+            if journal.is_complete(filename, stamp):
+                resumed += 1
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    chapter_data = json.load(f)
+            except ValueError:
+                print(f"  Chapter file {filename} is incomplete, fetching it again")
+            else:
+                print(f"  Chapter already exists: {filename}, skipping...")
+                journal.record(filename, stamp)
+                
+                # Update the corresponding chapter in novel_data
+                if chapter['url'] in chapter_indices:
+                    novel_data['chapters'][chapter_indices[chapter['url']]].update(chapter_data)
+                continue
+        
+        pending.append((chapter, chapter_index))
+    if resumed:
+        print(f"  {resumed} chapters already complete (journal), skipping...")
+    journal.compact()
+    
+    if pool is not None and jobs > 1:
+        # The pool spaces requests per exit, so jobs only need to keep every exit busy
+        if parse_workers is None:
+            parse_workers = os.cpu_count() or 1
+        print(f"Fetching {len(pending)} chapters with {jobs} jobs over {len(pool)} exits"
+              + (f", parsing in {parse_workers} processes" if parse_workers else ""))
+        # Parsing is CPU-bound and would serialize the fetch threads on the GIL, so pages go to
+        # worker processes. Each fetch thread waits for its page to be parsed before fetching
+        # the next one, which bounds the raw HTML in flight to `jobs` pages.
+        # Workers are spawned rather than forked, since they start while fetch threads are running.
+        parser_pool = (ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'))
+                       if parse_workers else None)
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                if parser_pool is not None:
+                    futures = {executor.submit(fetch_and_parse, chapter['url'], pool, parser_pool, trace_id(chapter_index)): (chapter, chapter_index)
+                               for chapter, chapter_index in pending}
+                else:
+                    futures = {executor.submit(scrape_chapter_content, chapter['url'], pool=pool, chapter=trace_id(chapter_index)): (chapter, chapter_index)
+                               for chapter, chapter_index in pending}
+                # Results are saved on this thread, so the search index connection is never shared
+                for done, future in enumerate(as_completed(futures), 1):
+                    chapter, chapter_index = futures[future]
+                    print(f"Scraped chapter {done}/{len(pending)}: {chapter['title']}")
+                    save_chapter(chapter, chapter_index, future.result())
+        finally:
+            if parser_pool is not None:
+                parser_pool.shutdown()
+        journal.close()
+        if len(pool) > 1:
+            pool.print_stats()
+        return novel_data['chapters']
+    
+    # Scrape each chapter
+    for i, (chapter, chapter_index) in enumerate(pending):
+        print(f"Scraping chapter {i+1}/{len(pending)}: {chapter['title']}")
         
         # Add a delay between requests to avoid rate limiting
-        if i > 0:
+        if i > 0 and pool is None:
             time.sleep(delay)
         
         # Scrape chapter content
-        chapter_data = scrape_chapter_content(chapter['url'])
-        
-        if chapter_data:
-            # Create full chapter data by combining the original chapter data with the content
-            full_chapter_data = {**chapter, **chapter_data}
-            
-            # Save to file
-            with open(chapter_path, 'w', encoding='utf-8') as f:
-                json.dump(full_chapter_data, f, ensure_ascii=False, indent=4)
-            
-            print(f"  Saved to {chapter_filename}")
-            
-            # Update the corresponding chapter in novel_data
-            if chapter['url'] in chapter_indices:
-                novel_data['chapters'][chapter_indices[chapter['url']]].update(chapter_data)
-        else:
-            print(f"  Failed to scrape chapter")
+        save_chapter(chapter, chapter_index, scrape_chapter_content(chapter['url'], pool=pool, chapter=trace_id(chapter_index)))
     
+    journal.close()
     return novel_data['chapters']
 
+def load_saved_chapters(novel_data, output_dir="output", count=None):
+    """
+    Fill the chapter dicts in novel_data with the content of their saved chapter files
+    
+    scrape_all_chapters doesn't open chapters it skips, so call this when the content
+    of the chapters is needed in memory (e.g. for the _complete.json file).
+    
+    Args:
+        novel_data (dict): Novel information with chapters
+        output_dir (str): Directory the chapters were saved under
+        count (int): Only the first count chapters (default: all)
+    """
+    chapters_dir = get_chapters_dir(novel_data, output_dir)
+    for i, chapter in enumerate(novel_data['chapters'][:count]):
+        try:
+            with open(os.path.join(chapters_dir, chapter_filename(i)), 'r', encoding='utf-8') as f:
+                chapter.update(json.load(f))
+        except (FileNotFoundError, ValueError):
+            pass
+
 if __name__ == "__main__":
     # Load novel data from the previously created JSON file
     output_dir = "output"
@@ -211,9 +405,10 @@ if __name__ == "__main__":
         
         # Update the novel data with chapter content
         novel_data['chapters'] = updated_chapters
+        load_saved_chapters(novel_data, output_dir, count=len(chapters_to_scrape))
         
         # Save updated novel data
-        with open(os.path.join(output_dir, f"{novel_title}_with_content.json"), 'w', encoding='utf-8') as f:
+        with atomic_write(os.path.join(output_dir, f"{novel_title}_with_content.json")) as f:
             json.dump(novel_data, f, ensure_ascii=False, indent=4)
             
         print("Chapter scraping complete!")
@@ -0,0 +1,56 @@
+import json
+import os
+from atomic_io import write_json
+
+
+def chapter_key(index):
+    """File stem for the chapter at a 0-based position in the chapter list (matches scrape_all_chapters)."""
+    return f"chapter_{index+1:04d}"
+
+
+def build_title_index(chapters):
+    """
+    Build a mapping of chapter file stem to chapter title from the chapter list
+
+    Args:
+        chapters (list): Chapter dicts from scrape_wikidich_novel, in list order
+
+    Returns:
+        dict: e.g. {'chapter_0001': 'Chương 1: ...'}
+    """
+    return {chapter_key(i): chapter['title'] for i, chapter in enumerate(chapters) if chapter.get('title')}
+
+
+def title_index_path(output_dir, novel_title):
+    return os.path.join(output_dir, f"{novel_title}_titles.json")
+
+
+def save_title_index(index, output_dir, novel_title):
+    """Save the title index next to the novel info JSON"""
+    path = title_index_path(output_dir, novel_title)
+    write_json(path, index)
+    return path
+
+
+def load_title_index(output_dir, novel_title):
+    """
+    Load the title index, building it from <novel>_info.json if it is missing or older
+
+    Returns:
+        dict: Title index, empty if neither file exists
+    """
+    index_path = title_index_path(output_dir, novel_title)
+    info_path = os.path.join(output_dir, f"{novel_title}_info.json")
+    info_exists = os.path.exists(info_path)
+
+    if os.path.exists(index_path) and (not info_exists or os.path.getmtime(index_path) >= os.path.getmtime(info_path)):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    if not info_exists:
+        return {}
+    with open(info_path, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+    index = build_title_index(info.get('chapters', []))
+    save_title_index(index, output_dir, novel_title)
+    return index
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Import-time regression check for the entry-point scripts.
+
+Runs `python -X importtime -c "import <module>"` for each entry point and fails
+if a heavy dependency is imported eagerly, or if the cumulative import time
+exceeds its budget. Run it before committing changes to module-level imports:
+
+    python check_import_time.py
+"""
+import argparse
+import subprocess
+import sys
+
+# module -> (budget in milliseconds, heavy modules that must NOT load at import time)
+ENTRY_POINTS = {
+    "enhance_chapters": (150, ["openai", "google.generativeai", "httpx"]),
+    "upload_to_drive": (50, ["googleapiclient", "google_auth_oauthlib", "google.oauth2", "httplib2"]),
+    "wikidich_scraper": (400, ["pandas", "numpy"]),
+    "chapter_scraper": (400, ["pandas", "numpy"]),
+    "main": (400, ["pandas", "numpy", "openai", "googleapiclient", "pyarrow"]),
+    "export_to_txt": (50, ["requests", "bs4", "pandas"]),
+}
+
+
+def measure_import(module):
+    """
+    Imports a module in a fresh interpreter and parses `-X importtime` output.
+
+    Returns:
+        tuple: (cumulative microseconds for the module, set of imported module names)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not parts[1].isdigit():
+            continue  # header line
+        name = parts[2]
+        imported.add(name)
+        if name == module:
+            cumulative = int(parts[1])
+    return cumulative, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if entry-point import time regresses.")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: all entry points)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply budgets, e.g. 2.0 on slow CI machines")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules or ENTRY_POINTS:
+        budget_ms, forbidden = ENTRY_POINTS.get(module, (None, []))
+        try:
+            cumulative_us, imported = measure_import(module)
+        except RuntimeError as e:
+            failures.append(str(e))
+            continue
+
+        elapsed_ms = cumulative_us / 1000
+        eager = sorted(name for name in forbidden if name in imported)
+        status = "ok"
+        if eager:
+            status = "FAIL"
+            failures.append(f"{module} eagerly imports: {', '.join(eager)}")
+        if budget_ms is not None and elapsed_ms > budget_ms * args.scale:
+            status = "FAIL"
+            failures.append(f"{module} took {elapsed_ms:.1f} ms (budget {budget_ms * args.scale:.0f} ms)")
+        budget_text = f"{budget_ms * args.scale:.0f} ms" if budget_ms is not None else "-"
+        print(f"{module:20s} {elapsed_ms:8.1f} ms  (budget {budget_text})  {status}")
+
+    if failures:
+        print("\nImport-time check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nImport-time check passed.")
+
+
+if __name__ == "__main__":
+    main()
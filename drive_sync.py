@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tracing import span, chapter_id
+from atomic_io import write_json
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+DEFAULT_MANIFEST = 'drive_manifest.json'
+DEFAULT_WORKERS = 8
+# Files larger than this are uploaded in resumable chunks (must be a multiple of 256 KB)
+RESUMABLE_CHUNK_SIZE = 5 * 1024 * 1024
+MANIFEST_SAVE_EVERY = 50 # Uploads between manifest checkpoints
+
+
+class StorageBackend:
+    """Where synced files end up. Folder and file IDs are opaque strings."""
+
+    def find_folder(self, name, parent_id=None):
+        """Returns the ID of an existing folder, or None."""
+        raise NotImplementedError
+
+    def create_folder(self, name, parent_id=None):
+        """Creates a folder and returns its ID."""
+        raise NotImplementedError
+
+    def upload(self, file_path, parent_id=None, file_id=None):
+        """Uploads a file (replacing `file_id` if given) and returns the remote file ID."""
+        raise NotImplementedError
+
+    def ensure_folder(self, name, parent_id=None):
+        return self.find_folder(name, parent_id) or self.create_folder(name, parent_id)
+
+
+class DriveBackend(StorageBackend):
+    """Google Drive backend. Each worker thread gets its own service object (httplib2 is not thread-safe)."""
+
+    def __init__(self, creds, chunk_size=RESUMABLE_CHUNK_SIZE):
+        self.creds = creds
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+
+    @property
+    def service(self):
+        if not hasattr(self._local, 'service'):
+            from googleapiclient.discovery import build
+            self._local.service = build('drive', 'v3', credentials=self.creds, cache_discovery=False)
+        return self._local.service
+
+    def find_folder(self, name, parent_id=None):
+        escaped = name.replace('\\', '\\\\').replace("'", "\\'")
+        query = f"name = '{escaped}' and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false"
+        if parent_id:
+            query += f" and '{parent_id}' in parents"
+        result = self.service.files().list(q=query, spaces='drive', fields='files(id)', pageSize=1).execute()
+        files = result.get('files', [])
+        return files[0]['id'] if files else None
+
+    def create_folder(self, name, parent_id=None):
+        file_metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE}
+        if parent_id:
+            file_metadata['parents'] = [parent_id]
+        return self.service.files().create(body=file_metadata, fields='id').execute().get('id')
+
+    def upload(self, file_path, parent_id=None, file_id=None):
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaFileUpload
+
+        # Small files go up in a single request; large ones in resumable chunks
+        resumable = os.path.getsize(file_path) > self.chunk_size
+        media = MediaFileUpload(file_path, resumable=resumable, chunksize=self.chunk_size if resumable else -1)
+        files = self.service.files()
+        request = None
+        if file_id:
+            request = files.update(fileId=file_id, media_body=media, fields='id')
+        else:
+            file_metadata = {'name': os.path.basename(file_path)}
+            if parent_id:
+                file_metadata['parents'] = [parent_id]
+            request = files.create(body=file_metadata, media_body=media, fields='id')
+
+        try:
+            if not resumable:
+                return request.execute().get('id')
+            response = None
+            while response is None:
+                _, response = request.next_chunk()
+            return response.get('id')
+        except HttpError as e:
+            if file_id and e.resp.status == 404:
+                # The remote copy was deleted; upload it again as a new file
+                return self.upload(file_path, parent_id)
+            raise
+
+
+class LocalBackend(StorageBackend):
+    """Stand-in backend that mirrors the Drive layout into a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, folder_id):
+        return os.path.join(self.root, folder_id) if folder_id else self.root
+
+    def find_folder(self, name, parent_id=None):
+        folder_id = os.path.join(parent_id, name) if parent_id else name
+        return folder_id if os.path.isdir(self._path(folder_id)) else None
+
+    def create_folder(self, name, parent_id=None):
+        folder_id = os.path.join(parent_id, name) if parent_id else name
+        os.makedirs(self._path(folder_id), exist_ok=True)
+        return folder_id
+
+    def upload(self, file_path, parent_id=None, file_id=None):
+        file_id = file_id or os.path.join(parent_id or '', os.path.basename(file_path))
+        shutil.copyfile(file_path, self._path(file_id))
+        return file_id
+
+
+def load_manifest(path):
+    """Loads the sync manifest: folder IDs by path and, per local file, its md5 and remote ID."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+    manifest.setdefault('folders', {})
+    manifest.setdefault('files', {})
+    return manifest
+
+
+def save_manifest(manifest, path):
+    write_json(path, manifest, indent=2)
+
+
+def file_md5(file_path):
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def ensure_folder_path(backend, manifest, folder_path):
+    """
+    Returns the ID for a '/'-separated folder path, reusing IDs from the manifest
+    or existing remote folders before creating anything.
+    """
+    parent_id = None
+    current = ''
+    for name in folder_path.split('/'):
+        current = f"{current}/{name}" if current else name
+        folder_id = manifest['folders'].get(current)
+        if not folder_id:
+            folder_id = backend.ensure_folder(name, parent_id)
+            manifest['folders'][current] = folder_id
+        parent_id = folder_id
+    return parent_id
+
+
+def changed_files(manifest, file_paths):
+    """
+    Yields (path, md5) for files that are new or whose content changed.
+
+    Size and mtime are compared first so unchanged files are not re-hashed.
+    """
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        entry = manifest['files'].get(file_path)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            continue
+        md5 = file_md5(file_path)
+        if entry and entry.get('md5') == md5:
+            # Touched but identical: just refresh the stat fields
+            entry.update({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+            continue
+        yield file_path, md5
+
+
+def sync_files(backend, manifest, file_paths, folder_id, workers=DEFAULT_WORKERS, manifest_path=None, novel=None):
+    """
+    Uploads new or changed files into `folder_id` on a bounded thread pool.
+
+    Args:
+        backend (StorageBackend): Upload target
+        manifest (dict): Manifest from load_manifest, updated in place
+        file_paths (list): Local files that belong in this folder
+        folder_id (str): Remote folder ID
+        workers (int): Maximum concurrent uploads
+        manifest_path (str): If given, the manifest is checkpointed during the sync so an interrupted run resumes
+        novel (str): Novel name for the upload spans in the trace (see tracing.py)
+
+    Returns:
+        tuple: (uploaded count, unchanged count, failed count)
+    """
+    pending = list(changed_files(manifest, file_paths))
+    unchanged = len(file_paths) - len(pending)
+    uploaded = 0
+    failed = 0
+
+    def upload_one(file_path, md5):
+        entry = manifest['files'].get(file_path, {})
+        existing_id = entry.get('file_id') if entry.get('folder_id') == folder_id else None
+        with span('upload', chapter_id(novel, file_path), bytes=os.path.getsize(file_path)):
+            return backend.upload(file_path, folder_id, existing_id)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload_one, path, md5): (path, md5) for path, md5 in pending}
+        for future in as_completed(futures):
+            file_path, md5 = futures[future]
+            try:
+                file_id = future.result()
+            except Exception as e:
+                failed += 1
+                print(f'Failed to upload {file_path}: {e}')
+                continue
+            # Results are collected on this thread only, so the manifest needs no lock
+            stat = os.stat(file_path)
+            manifest['files'][file_path] = {
+                'md5': md5,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'file_id': file_id,
+                'folder_id': folder_id,
+            }
+            uploaded += 1
+            if manifest_path and uploaded % MANIFEST_SAVE_EVERY == 0:
+                save_manifest(manifest, manifest_path)
+            print(f'Uploaded {os.path.basename(file_path)} ({uploaded}/{len(pending)})')
+
+    if manifest_path:
+        save_manifest(manifest, manifest_path)
+    return uploaded, unchanged, failed
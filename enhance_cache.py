@@ -0,0 +1,126 @@
+import difflib
+import hashlib
+import json
+import os
+from atomic_io import atomic_write
+
+# Bump when the record layout or paragraph splitting changes
+CACHE_VERSION = 1
+CACHE_DIR = ".enhance_cache"
+# Unchanged paragraphs sent on each side of a changed run, so the model sees the surrounding scene
+CONTEXT_PARAGRAPHS = 2
+# Above this fraction of changed paragraphs one whole-chapter call is cheaper than several windows
+MAX_PARTIAL_FRACTION = 0.5
+
+
+def split_paragraphs(text):
+    """Non-empty lines: chapters are one paragraph per line (blank-line separated or not)."""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def paragraph_hash(paragraph):
+    return hashlib.sha1(" ".join(paragraph.split()).encode("utf-8")).hexdigest()[:16]
+
+
+def prompt_hash(base_prompt):
+    return hashlib.sha1(base_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def record_path(output_dir, filename):
+    return os.path.join(output_dir, CACHE_DIR, filename + ".json")
+
+
+def load_record(output_dir, filename, base_prompt):
+    """
+    Previous enhancement of a chapter, or None.
+
+    Records made with a different prompt are ignored, since their output
+    would not match what the current prompt asks for.
+    """
+    try:
+        with open(record_path(output_dir, filename), "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if record.get("version") != CACHE_VERSION or record.get("prompt") != prompt_hash(base_prompt):
+        return None
+    return record
+
+
+def save_record(output_dir, filename, base_prompt, source_paragraphs, output_text, output_paragraphs=None):
+    """
+    Stores a chapter's enhancement.
+
+    output_paragraphs is the output split one-to-one with source_paragraphs;
+    when the model's output could not be aligned it is None, and a later
+    revision of the chapter has to be enhanced in full.
+    """
+    if output_paragraphs is None:
+        candidate = split_paragraphs(output_text)
+        if len(candidate) == len(source_paragraphs):
+            output_paragraphs = candidate
+    record = {
+        "version": CACHE_VERSION,
+        "prompt": prompt_hash(base_prompt),
+        "source": [paragraph_hash(p) for p in source_paragraphs],
+        "text": output_text,
+        "paragraphs": output_paragraphs,
+    }
+    with atomic_write(record_path(output_dir, filename)) as f:
+        json.dump(record, f, ensure_ascii=False)
+
+
+def plan_revision(record, paragraphs):
+    """
+    Works out what has to be re-enhanced for a chapter with a previous record.
+
+    Returns:
+        None if the chapter must be enhanced in full, otherwise (merged, windows):
+        merged is the new chapter's output paragraphs with None where the paragraph
+        changed, windows a list of (start, end, context_start, context_end) ranges
+        of new paragraphs to re-enhance (empty if nothing changed).
+    """
+    hashes = [paragraph_hash(p) for p in paragraphs]
+    if hashes == record["source"]:
+        return [], []
+    if record["paragraphs"] is None:
+        return None
+
+    merged = [None] * len(paragraphs)
+    changed = []
+    matcher = difflib.SequenceMatcher(None, record["source"], hashes, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            merged[new_start:new_end] = record["paragraphs"][old_start:old_end]
+        elif new_end > new_start: # Deleted paragraphs need no call at all
+            changed.append((new_start, new_end))
+    if sum(end - start for start, end in changed) > MAX_PARTIAL_FRACTION * len(paragraphs):
+        return None
+
+    # Runs whose context would overlap are sent together
+    windows = []
+    for start, end in changed:
+        context_start = max(0, start - CONTEXT_PARAGRAPHS)
+        context_end = min(len(paragraphs), end + CONTEXT_PARAGRAPHS)
+        if windows and context_start <= windows[-1][3]:
+            windows[-1] = (windows[-1][0], end, windows[-1][2], context_end)
+        else:
+            windows.append((start, end, context_start, context_end))
+    return merged, windows
+
+
+def merge_window(merged, window, output_text):
+    """
+    Puts a re-enhanced window back into the chapter's output paragraphs.
+
+    The context paragraphs of the window's output are dropped (their earlier
+    enhancement is kept). Returns False if the output doesn't line up with
+    the paragraphs that were sent.
+    """
+    start, end, context_start, context_end = window
+    output = split_paragraphs(output_text)
+    if len(output) != context_end - context_start:
+        return False
+    for position in range(start, end):
+        merged[position] = output[position - context_start]
+    return True
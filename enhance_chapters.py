@@ -1,18 +1,23 @@
 import os
 import re # Import regex module for substitution
-import google.generativeai as genai # No longer needed
-import openai # Use OpenAI library for DeepSeek
 from dotenv import load_dotenv
 import time # Import time for potential delays/retries
 import argparse # Import argparse for command-line arguments
 import asyncio # Import asyncio for parallel processing
+from llm_providers import DeepSeekProvider, GeminiProvider, ProviderPool, ProviderError
+from enhance_planner import plan_enhancement, print_plan
+from chapter_dedup import build_fingerprint_index, find_duplicates, print_duplicate_report
+from chapter_pack import open_chapter_source, PACK_SUFFIX
+from enhance_cache import split_paragraphs, paragraph_hash, prompt_hash, load_record, save_record, plan_revision, merge_window
+from atomic_io import atomic_write, file_stamp, CompletionJournal
+from tracing import record_span, chapter_id
 
 # --- Configuration ---
 INPUT_DIR = "output/mục_thần_ký_txt"
 OUTPUT_DIR = "enhance_output"
 PROMPT_FILE = "prompt/translate.prompt.txt"
 PROMPT_PLACEHOLDER = "[Dán đoạn văn cần biên tập ở đây]"
-# GEMINI_MODEL_NAME = "gemini-2.5-pro-exp-03-25" # Old model name
+GEMINI_MODEL_NAME = "gemini-1.5-pro" # Target Gemini model
 DEEPSEEK_MODEL_NAME = "deepseek-chat" # Target DeepSeek model
 DEEPSEEK_API_BASE = "https://api.deepseek.com" # DeepSeek API endpoint
 DEEPSEEK_TEMPERATURE = 1.3 # Recommended temperature for DeepSeek
@@ -27,33 +32,35 @@ GEMINI_OUTPUT_PRICE = 0.0105
 DEEPSEEK_INPUT_PRICE = 0.00027 # $0.27 / 1M tokens
 DEEPSEEK_OUTPUT_PRICE = 0.00110 # $1.10 / 1M tokens
 
+# Per-provider concurrency (in addition to the overall --limit)
+DEEPSEEK_CONCURRENCY = 10
+GEMINI_CONCURRENCY = 5
+
+# Dry-run planning assumptions (per provider): enhanced output size relative to the chapter,
+# fixed per-call latency, generation speed and account rate limits (None = unlimited)
+PLANNING = {
+    "deepseek": {"output_ratio": 1.1, "base_latency": 5.0, "output_tokens_per_second": 25.0,
+                 "requests_per_minute": None, "tokens_per_minute": None},
+    "gemini": {"output_ratio": 1.1, "base_latency": 4.0, "output_tokens_per_second": 40.0,
+               "requests_per_minute": 60, "tokens_per_minute": None},
+}
+PRICING = {
+    "deepseek": (DEEPSEEK_INPUT_PRICE, DEEPSEEK_OUTPUT_PRICE),
+    "gemini": (GEMINI_INPUT_PRICE, GEMINI_OUTPUT_PRICE),
+}
+PROVIDER_CONCURRENCY = {"deepseek": DEEPSEEK_CONCURRENCY, "gemini": GEMINI_CONCURRENCY}
+
+DEFAULT_PROVIDERS = "deepseek" # Comma-separated, in priority order (e.g. "deepseek,gemini")
+HEDGE_PERCENTILE = 95 # Fire a hedged request once the primary exceeds this latency percentile (0 disables)
+
 MAX_CUMULATIVE_COST_USD = 5.00 # Cost limit for warnings
 CONCURRENT_LIMIT = 10 # Limit the number of concurrent API calls
 MAX_RETRIES = 3
 RETRY_DELAY_SECONDS = 30
 
-# --- Load Environment Variables ---
-load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-
-# Global variables for API clients (configured in main)
-openai_client = None
-
-# if not API_KEY:
-#     print("Error: GOOGLE_API_KEY not found in environment variables.")
-#     print("Please ensure it is set in your .env file or environment.")
-#     exit()
-if not DEEPSEEK_API_KEY:
-    print("Error: DEEPSEEK_API_KEY not found in environment variables.")
-    print("Please ensure it is set in your .env file.")
-    exit()
-
-# Configure OpenAI client for DeepSeek
-client = openai.AsyncOpenAI(
-    api_key=DEEPSEEK_API_KEY,
-    base_url=DEEPSEEK_API_BASE,
-)
+# --- Environment Variables (loaded from .env in main, not at import time) ---
+GOOGLE_API_KEY_ENV = "GOOGLE_API_KEY"
+DEEPSEEK_API_KEY_ENV = "DEEPSEEK_API_KEY"
 
 
 # --- Helper Functions ---
@@ -76,100 +83,155 @@ def read_file_content(filepath):
         return None
 
 def write_file_content(filepath, content):
-    """Synchronous file writing."""
+    """Synchronous file writing (atomic: a killed run never leaves a truncated file)."""
     try:
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, 'w', encoding='utf-8') as f:
+        with atomic_write(filepath) as f:
             f.write(content)
         return True # Indicate success
     except Exception as e:
         print(f"Error writing file {filepath}: {e}")
         return False # Indicate failure
 
-async def call_deepseek_api_async(prompt_text, filename):
-    """Calls the DeepSeek API asynchronously with retries and returns content + usage."""
-    print(f"[{filename}] Calling DeepSeek API ({DEEPSEEK_MODEL_NAME})... Length: {len(prompt_text)}")
-    last_exception = None
-    for attempt in range(MAX_RETRIES):
-        try:
-            response = await client.chat.completions.create(
-                model=DEEPSEEK_MODEL_NAME,
-                messages=[{"role": "user", "content": prompt_text}],
-                temperature=DEEPSEEK_TEMPERATURE
-            )
-            # ... rest of successful response handling ...
-            input_tokens = response.usage.prompt_tokens if response.usage else 0
-            output_tokens = response.usage.completion_tokens if response.usage else 0
-            enhanced_text = response.choices[0].message.content if response.choices and response.choices[0].message else None
-
-            if not enhanced_text:
-                print(f"[{filename}] Warning: DeepSeek API response did not contain message content (Attempt {attempt + 1}/{MAX_RETRIES}).")
-                return None, input_tokens, output_tokens
-
-            print(f"[{filename}] DeepSeek API Call Successful (Attempt {attempt + 1}/{MAX_RETRIES}).")
-            return enhanced_text, input_tokens, output_tokens
-
-        except Exception as e:
-            last_exception = e
-            print(f"[{filename}] Error during DeepSeek API call (Attempt {attempt + 1}/{MAX_RETRIES}): {e}")
-            if attempt < MAX_RETRIES - 1:
-                print(f"[{filename}] Retrying in {RETRY_DELAY_SECONDS} seconds...")
-                await asyncio.sleep(RETRY_DELAY_SECONDS)
-            else:
-                print(f"[{filename}] Max retries reached. Giving up.")
-
-    # If loop finishes without returning, it means all retries failed
-    return None, 0, 0
-
-async def call_gemini_api_async(prompt_text, filename):
-    """Calls the Gemini API asynchronously and returns content + usage."""
-    print(f"[{filename}] Calling Gemini API ({GEMINI_MODEL_NAME})... Length: {len(prompt_text)}")
-    try:
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-        # Ensure no explicit generation_config for temperature is passed
-        response = await model.generate_content_async(
-            prompt_text
-            # No generation_config here
-            )
-        # ... rest of gemini call ...
-        input_tokens = 0
-        output_tokens = 0
-        if response.usage_metadata:
-            input_tokens = response.usage_metadata.prompt_token_count
-            output_tokens = response.usage_metadata.candidates_token_count
-
-        if not response.parts:
-             print(f"[{filename}] Warning: Gemini API response did not contain parts. Check safety ratings.")
-             print(f"[{filename}] Prompt feedback: {response.prompt_feedback}")
-             return None, input_tokens, output_tokens
-
-        enhanced_text = response.text
-        print(f"[{filename}] Gemini API Call Complete.")
-        return enhanced_text, input_tokens, output_tokens
-
-    except Exception as e:
-        print(f"[{filename}] Error during Gemini API call: {e}")
-        return None, 0, 0
-
-async def process_chapter(filename, base_prompt, semaphore):
-    """Reads chapter, calls API async, writes file, returns results."""
-    input_filepath = os.path.join(INPUT_DIR, filename)
+def novel_from_input(input_path):
+    """Novel name from an input like output/mục_thần_ký_txt or output/mục_thần_ký_txt.pack"""
+    name = os.path.basename(input_path.rstrip("/"))
+    if name.endswith(PACK_SUFFIX):
+        name = name[:-len(PACK_SUFFIX)]
+    return name[:-len("_txt")] if name.endswith("_txt") else name
+
+def journal_stamp(source, filename, base_prompt, output_filepath):
+    """What a finished chapter is journaled with: its source stamp, the prompt and the output file's stamp."""
+    output_stamp = file_stamp(output_filepath)
+    if output_stamp is None:
+        return None
+    return list(source.stamp(filename)) + [prompt_hash(base_prompt)] + output_stamp
+
+def build_provider(name):
+    """Creates a configured provider by name, or None if its API key is missing."""
+    if name == "deepseek":
+        api_key = os.getenv(DEEPSEEK_API_KEY_ENV)
+        if not api_key:
+            print("Error: DEEPSEEK_API_KEY not found in environment variables.")
+            print("Please ensure it is set in your .env file.")
+            return None
+        return DeepSeekProvider(
+            api_key=api_key,
+            base_url=DEEPSEEK_API_BASE,
+            model=DEEPSEEK_MODEL_NAME,
+            input_price=DEEPSEEK_INPUT_PRICE,
+            output_price=DEEPSEEK_OUTPUT_PRICE,
+            temperature=DEEPSEEK_TEMPERATURE,
+            concurrency=DEEPSEEK_CONCURRENCY,
+            cooldown_seconds=RETRY_DELAY_SECONDS,
+        )
+    if name == "gemini":
+        api_key = os.getenv(GOOGLE_API_KEY_ENV)
+        if not api_key:
+            print("Error: GOOGLE_API_KEY not found in environment variables.")
+            print("Please ensure it is set in your .env file.")
+            return None
+        return GeminiProvider(
+            api_key=api_key,
+            model=GEMINI_MODEL_NAME,
+            input_price=GEMINI_INPUT_PRICE,
+            output_price=GEMINI_OUTPUT_PRICE,
+            concurrency=GEMINI_CONCURRENCY,
+            cooldown_seconds=RETRY_DELAY_SECONDS,
+        )
+    print(f"Error: Unknown provider '{name}'.")
+    return None
+
+async def enhance_windows(filename, base_prompt, pool, paragraphs, merged, windows):
+    """
+    Re-enhances only the changed paragraph windows of a revised chapter.
+
+    Returns (output paragraphs, input tokens, output tokens, cost), or None if a
+    window's output didn't line up and the chapter has to be enhanced in full.
+    """
+    input_tokens = output_tokens = 0
+    cost = 0.0
+    for window in windows:
+        _, _, context_start, context_end = window
+        window_text = "\n\n".join(paragraphs[context_start:context_end])
+        full_prompt = re.sub(re.escape(PROMPT_PLACEHOLDER), window_text, base_prompt, count=1)
+        enhanced, window_in, window_out, provider_name = await pool.complete(full_prompt, f"{filename}[{context_start}:{context_end}]")
+        input_tokens += window_in
+        output_tokens += window_out
+        cost += pool.get(provider_name).cost(window_in, window_out)
+        if not merge_window(merged, window, enhanced):
+            print(f"[{filename}] Window output doesn't match its paragraphs, enhancing the whole chapter.")
+            return None
+    return merged, input_tokens, output_tokens, cost
+
+async def process_chapter(filename, base_prompt, semaphore, pool, source, use_cache=True, novel=None, journal=None):
+    """
+    Reads chapter from the source (directory or pack), calls API async, writes file, returns results.
+
+    With use_cache, a chapter enhanced before is only sent again where its paragraphs changed:
+    unchanged chapters cost nothing, revised ones only their changed windows. A chapter the
+    journal lists as finished from the same source and prompt isn't even read.
+    """
     output_filepath = os.path.join(OUTPUT_DIR, filename)
+    if use_cache and journal is not None and journal.is_complete(filename, journal_stamp(source, filename, base_prompt, output_filepath)):
+        return filename, "resumed", 0, 0, 0.0, True
     write_success = False
     input_tokens = 0
     output_tokens = 0
+    cost = 0.0
+    mode = "failed"
+    queued_at = time.time()
 
     async with semaphore: # Limit concurrency
+        started_at = time.time()
         # Read chapter content (synchronous, but okay within semaphore)
-        chapter_content = read_file_content(input_filepath)
+        try:
+            _, chapter_content, _ = source.read_chapter(filename)
+        except Exception as e:
+            print(f"Error reading chapter {filename}: {e}")
+            chapter_content = None
         if chapter_content is None:
-            return filename, input_tokens, output_tokens, write_success # Return failure
-
-        # Format the full prompt
-        full_prompt = re.sub(re.escape(PROMPT_PLACEHOLDER), chapter_content, base_prompt, count=1)
-
-        # Call the DeepSeek API asynchronously
-        enhanced_content, input_tokens, output_tokens = await call_deepseek_api_async(full_prompt, filename)
+            record_span("enhance", chapter_id(novel, filename), started_at, "failed", queued=started_at - queued_at)
+            return filename, mode, input_tokens, output_tokens, cost, write_success # Return failure
+
+        paragraphs = split_paragraphs(chapter_content)
+        enhanced_content = None
+        output_paragraphs = None
+        record = load_record(OUTPUT_DIR, filename, base_prompt) if use_cache else None
+        revision = plan_revision(record, paragraphs) if record else None
+        if revision is not None:
+            merged, windows = revision
+            if [paragraph_hash(p) for p in paragraphs] == record["source"]:
+                print(f"[{filename}] Unchanged since last enhancement, reusing it.")
+                enhanced_content, mode = record["text"], "cached"
+            elif not windows:
+                # Paragraphs were only deleted: drop their enhancement, no call needed
+                print(f"[{filename}] {len(record['source']) - len(paragraphs)} paragraphs removed, no re-enhancement needed.")
+                output_paragraphs = merged
+                enhanced_content, mode = "\n\n".join(output_paragraphs), "partial"
+            else:
+                changed = sum(end - start for start, end, _, _ in windows)
+                print(f"[{filename}] {changed}/{len(paragraphs)} paragraphs changed, re-enhancing {len(windows)} window(s).")
+                try:
+                    result = await enhance_windows(filename, base_prompt, pool, paragraphs, merged, windows)
+                except ProviderError:
+                    result = None
+                if result is not None:
+                    output_paragraphs, input_tokens, output_tokens, cost = result
+                    enhanced_content, mode = "\n\n".join(output_paragraphs), "partial"
+
+        if enhanced_content is None:
+            # Format the full prompt
+            full_prompt = re.sub(re.escape(PROMPT_PLACEHOLDER), chapter_content, base_prompt, count=1)
+
+            # Call the provider pool asynchronously (hedging and failover handled by the pool)
+            try:
+                enhanced_content, full_in, full_out, provider_name = await pool.complete(full_prompt, filename)
+                input_tokens += full_in
+                output_tokens += full_out
+                cost += pool.get(provider_name).cost(full_in, full_out)
+                mode = "full"
+            except ProviderError:
+                enhanced_content = None
 
         # Write the file immediately if API call was successful
         if enhanced_content is not None:
@@ -177,23 +239,41 @@ async def process_chapter(filename, base_prompt, semaphore):
             write_success = write_file_content(output_filepath, enhanced_content)
             if write_success:
                 print(f"[{filename}] Successfully wrote enhanced file.")
+                if mode != "cached":
+                    save_record(OUTPUT_DIR, filename, base_prompt, paragraphs, enhanced_content, output_paragraphs)
+                if journal is not None:
+                    journal.record(filename, journal_stamp(source, filename, base_prompt, output_filepath))
             else:
                 print(f"[{filename}] Failed to write enhanced file.")
         else:
             print(f"[{filename}] Skipping write due to API issue.")
 
-    return filename, input_tokens, output_tokens, write_success
+        # Traced inside the semaphore, so the span is the chapter's own time; the wait is recorded as `queued`
+        record_span("enhance", chapter_id(novel, filename), started_at,
+                    "ok" if write_success else "failed", queued=started_at - queued_at, mode=mode,
+                    bytes=len(chapter_content.encode("utf-8")), input_tokens=input_tokens,
+                    output_tokens=output_tokens, cost=cost)
+
+    return filename, mode, input_tokens, output_tokens, cost, write_success
 
 # --- Main Script (Async) ---
 
 async def main():
     # --- Argument Parsing ---
-    parser = argparse.ArgumentParser(description="Enhance chapter text using DeepSeek API concurrently.")
+    parser = argparse.ArgumentParser(description="Enhance chapter text using LLM providers concurrently.")
     group = parser.add_mutually_exclusive_group() # Ensure conflicting args aren't used together
     group.add_argument("-c", "--chapter", type=str, help="Specify a single chapter filename (e.g., chapter_1337.txt) to process.")
     group.add_argument("-s", "--start-chapter", type=str, help="Specify the filename of the chapter to start processing from.")
     parser.add_argument("-o", "--offset", type=int, help="Number of chapters to process, starting from --start-chapter (requires --start-chapter). Default: process all chapters from start.")
+    parser.add_argument("-i", "--input", type=str, default=INPUT_DIR, help=f"Directory of chapter txt files, or a .pack file built by chapter_pack.py (default: {INPUT_DIR}).")
     parser.add_argument("--limit", type=int, default=CONCURRENT_LIMIT, help=f"Maximum number of concurrent API calls (default: {CONCURRENT_LIMIT}).")
+    parser.add_argument("--provider", type=str, default=DEFAULT_PROVIDERS, help=f"Comma-separated providers in priority order, e.g. 'deepseek,gemini'. Later providers are used for hedging and failover (default: {DEFAULT_PROVIDERS}).")
+    parser.add_argument("--skip-duplicates", action="store_true", help="Skip chapters that are exact or near duplicates of an earlier chapter.")
+    parser.add_argument("--dry-run", action="store_true", help="Estimate tokens, cost and wall time locally for the selected chapters without calling any API.")
+    parser.add_argument("--rpm", type=int, help="Requests-per-minute limit to assume in --dry-run (overrides the provider default).")
+    parser.add_argument("--tpm", type=int, help="Tokens-per-minute limit to assume in --dry-run (overrides the provider default).")
+    parser.add_argument("--force", action="store_true", help="Enhance every selected chapter in full, ignoring earlier enhancements.")
+    parser.add_argument("--hedge-percentile", type=float, default=HEDGE_PERCENTILE, help=f"Hedge to the next provider once a call exceeds this latency percentile; 0 disables hedging (default: {HEDGE_PERCENTILE}).")
 
     args = parser.parse_args()
 
@@ -204,6 +284,14 @@ async def main():
         parser.error("--offset must be a positive integer.")
     if args.limit <= 0:
         parser.error("--limit must be a positive integer.")
+    if not 0 <= args.hedge_percentile < 100:
+        parser.error("--hedge-percentile must be between 0 and 100.")
+    provider_names = [name.strip() for name in args.provider.split(",") if name.strip()]
+    if not provider_names:
+        parser.error("--provider must name at least one provider.")
+    unknown = [name for name in provider_names if name not in PRICING]
+    if unknown:
+        parser.error(f"Unknown provider(s): {', '.join(unknown)}. Choose from: {', '.join(PRICING)}.")
 
     # --- Script Start ---
 
@@ -216,31 +304,22 @@ async def main():
         print(f"Error: Prompt placeholder '{PROMPT_PLACEHOLDER}' not found in {PROMPT_FILE}. Exiting.")
         return
 
-    # 2. Configure API Client (DeepSeek client configured globally)
-
-    # 3. Ensure output directory exists (synchronous)
-    try:
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        print(f"Output directory '{OUTPUT_DIR}' ensured.")
-    except Exception as e:
-        print(f"Error creating output directory {OUTPUT_DIR}: {e}. Exiting.")
-        return
-
-    # 4. Determine files to process (based on args) (synchronous)
+    # 2. Determine files to process (based on args) (synchronous)
+    input_path = args.input
     files_to_process = []
     all_files = []
     try:
-        # List and naturally sort all potential files first
-        all_files_unsorted = [f for f in os.listdir(INPUT_DIR) if os.path.isfile(os.path.join(INPUT_DIR, f)) and f.endswith('.txt')]
-        all_files = sorted(all_files_unsorted, key=natural_sort_key)
+        # List and naturally sort all potential files first (from a directory or a pack)
+        source = open_chapter_source(input_path, suffix='.txt')
+        all_files = sorted(source.names(), key=natural_sort_key)
         if not all_files:
-            print(f"No .txt files found in {INPUT_DIR}.")
+            print(f"No .txt chapters found in {input_path}.")
             return
     except FileNotFoundError:
-        print(f"Error: Input directory not found at {INPUT_DIR}. Exiting.")
+        print(f"Error: Input not found at {input_path}. Exiting.")
         return
     except Exception as e:
-        print(f"Error listing or sorting files in {INPUT_DIR}: {e}. Exiting.")
+        print(f"Error listing or sorting files in {input_path}: {e}. Exiting.")
         return
 
     # Select files based on arguments
@@ -251,7 +330,7 @@ async def main():
             files_to_process.append(chapter_filename)
             print(f"Processing specified chapter: {chapter_filename}")
         else:
-            print(f"Error: Specified chapter file '{chapter_filename}' not found in {INPUT_DIR}")
+            print(f"Error: Specified chapter file '{chapter_filename}' not found in {input_path}")
             return
     elif args.start_chapter:
         # Process from start chapter, potentially with an offset
@@ -259,7 +338,7 @@ async def main():
         try:
             start_index = all_files.index(start_filename)
         except ValueError:
-            print(f"Error: Start chapter '{start_filename}' not found in {INPUT_DIR}.")
+            print(f"Error: Start chapter '{start_filename}' not found in {input_path}.")
             return
 
         if args.offset:
@@ -276,32 +355,87 @@ async def main():
     else:
         # Process all .txt files in the input directory (default behavior)
         files_to_process = all_files
-        print(f"Selected all {len(files_to_process)} chapters found in {INPUT_DIR} for processing.")
+        print(f"Selected all {len(files_to_process)} chapters found in {input_path} for processing.")
+
+    # Drop reposted chapters before they reach the paid API
+    if args.skip_duplicates:
+        index = build_fingerprint_index(source)
+        process_set = set(files_to_process)
+        duplicates = {f: dup for f, dup in find_duplicates(index).items() if f in process_set}
+        print_duplicate_report(index, duplicates)
+        files_to_process = [f for f in files_to_process if f not in duplicates]
+        if not files_to_process:
+            print("No chapters left to process after skipping duplicates. Exiting.")
+            return
+
+    # 3. Dry run: estimate locally and stop before touching any API
+    if args.dry_run:
+        primary = provider_names[0]
+        concurrency = min(args.limit, PROVIDER_CONCURRENCY[primary])
+        planning = dict(PLANNING[primary])
+        if args.rpm:
+            planning["requests_per_minute"] = args.rpm
+        if args.tpm:
+            planning["tokens_per_minute"] = args.tpm
+        input_price, output_price = PRICING[primary]
+        plan = plan_enhancement(source, files_to_process, base_prompt, PROMPT_PLACEHOLDER,
+                                input_price, output_price, concurrency, **planning)
+        print_plan(plan, primary, concurrency)
+        if plan["cost"] >= MAX_CUMULATIVE_COST_USD:
+            print(f"*** Warning: Estimated cost exceeds the limit of ${MAX_CUMULATIVE_COST_USD:.2f} ***")
+        return
 
-    # 5. Create and run tasks concurrently
+    # 4. Configure API providers
+    load_dotenv()
+    providers = []
+    for name in provider_names:
+        provider = build_provider(name)
+        if provider is None:
+            print("Exiting.")
+            return
+        providers.append(provider)
+    pool = ProviderPool(providers, hedge_percentile=args.hedge_percentile, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY_SECONDS)
+    print(f"Using providers: {', '.join(p.name for p in providers)}")
+
+    # 5. Ensure output directory exists (synchronous)
+    try:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        print(f"Output directory '{OUTPUT_DIR}' ensured.")
+    except Exception as e:
+        print(f"Error creating output directory {OUTPUT_DIR}: {e}. Exiting.")
+        return
+
+    # 6. Create and run tasks concurrently
+    journal = CompletionJournal(OUTPUT_DIR)
+    journal.compact()
     semaphore = asyncio.Semaphore(args.limit)
-    tasks = [process_chapter(filename, base_prompt, semaphore) for filename in files_to_process]
+    tasks = [process_chapter(filename, base_prompt, semaphore, pool, source, not args.force, novel_from_input(input_path), journal) for filename in files_to_process]
     print(f"\nStarting concurrent processing of {len(tasks)} chapters with limit {args.limit}...")
     results = await asyncio.gather(*tasks)
+    journal.close()
     print("\n...Concurrent processing finished.")
 
-    # 6. Process results and calculate costs
+    # 7. Process results and calculate costs
     print("\nCalculating final costs...")
     cumulative_cost = 0.0
     processed_count = 0
     skipped_count = 0
+    mode_counts = {}
 
-    for filename, input_tokens, output_tokens, write_success in results:
+    for filename, mode, input_tokens, output_tokens, call_cost, write_success in results:
 
-        # Calculate cost for this specific result (using updated price constants)
-        input_cost = (input_tokens / 1000) * DEEPSEEK_INPUT_PRICE
-        output_cost = (output_tokens / 1000) * DEEPSEEK_OUTPUT_PRICE
-        call_cost = input_cost + output_cost
+        # Cost is priced per call by the provider that answered it
+        mode_counts[mode] = mode_counts.get(mode, 0) + 1
+        if mode == "resumed":
+            # Finished by an earlier run, nothing to report
+            processed_count += 1
+            continue
         cumulative_cost += call_cost
         limit_exceeded_after = cumulative_cost >= MAX_CUMULATIVE_COST_USD
 
         # Log cost details for this chapter
         print(f"\n--- Result for: {filename} ---")
+        print(f"  Mode         : {mode}")
         print(f"  Input Tokens : {input_tokens}")
         print(f"  Output Tokens: {output_tokens}")
         print(f"  Estimated Cost: ${call_cost:.6f}")
@@ -318,7 +452,10 @@ async def main():
     print(f"\n--- Script finished ---")
     print(f"Total chapters processed: {processed_count}")
     print(f"Total chapters skipped : {skipped_count}")
+    print(f"Enhanced in full: {mode_counts.get('full', 0)}, partially: {mode_counts.get('partial', 0)}, unchanged (cached): {mode_counts.get('cached', 0)}, finished by an earlier run: {mode_counts.get('resumed', 0)}")
     print(f"Final Estimated Cumulative Cost: ${cumulative_cost:.6f}")
+    if pool.hedges_fired:
+        print(f"Hedged requests fired: {pool.hedges_fired} (won by backup: {pool.hedges_won})")
     if cumulative_cost >= MAX_CUMULATIVE_COST_USD:
         print(f"*** Warning: Final cumulative cost exceeded the limit of ${MAX_CUMULATIVE_COST_USD:.2f} ***")
 
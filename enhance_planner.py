@@ -0,0 +1,130 @@
+import hashlib
+import json
+import re
+
+# Bump when the estimator or cache layout changes so cached counts are recomputed
+TOKENIZER_VERSION = 2
+PLAN_CACHE_FILE = ".enhance_plan_cache.json"
+
+# Approximate BPE behaviour without a tokenizer: every whitespace-separated piece and
+# every punctuation mark costs about one token, and Vietnamese diacritics add roughly
+# one more token per two extra UTF-8 bytes (e.g. "đứng" is 4 chars, 7 bytes, ~2.5 tokens)
+EXTRA_BYTES_PER_TOKEN = 2.0
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text):
+    """Approximate token count for text, without any network or tokenizer download."""
+    extra_bytes = len(text.encode("utf-8")) - len(text)
+    return len(text.split()) + len(PUNCTUATION_PATTERN.findall(text)) + int(extra_bytes / EXTRA_BYTES_PER_TOKEN)
+
+
+def load_plan_cache(source):
+    """Loads the token-count cache for a chapter source (directory or pack)."""
+    path = source.cache_path(PLAN_CACHE_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = {}
+    if cache.get("version") != TOKENIZER_VERSION:
+        cache = {"version": TOKENIZER_VERSION, "files": {}, "hashes": {}}
+    return cache
+
+
+def save_plan_cache(source, cache):
+    path = source.cache_path(PLAN_CACHE_FILE)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"Warning: could not save plan cache {path}: {e}")
+
+
+def count_chapter_tokens(source, name, cache):
+    """
+    Returns the estimated token count for a chapter.
+
+    Chapters whose stamp (size and mtime for files, length and CRC for packs)
+    is unchanged are answered from the cache without being read; otherwise the
+    content hash is looked up before falling back to tokenizing.
+    """
+    stamp = list(source.stamp(name))
+    entry = cache["files"].get(name)
+    if entry and entry["stamp"] == stamp:
+        return entry["tokens"]
+
+    data = bytes(source.read_bytes(name))
+    digest = hashlib.sha1(data).hexdigest()
+    tokens = cache["hashes"].get(digest)
+    if tokens is None:
+        tokens = estimate_tokens(data.decode("utf-8", errors="replace"))
+        cache["hashes"][digest] = tokens
+    cache["files"][name] = {"stamp": stamp, "sha1": digest, "tokens": tokens}
+    return tokens
+
+
+def plan_enhancement(source, filenames, base_prompt, placeholder, input_price, output_price,
+                     concurrency, output_ratio=1.1, base_latency=5.0, output_tokens_per_second=30.0,
+                     requests_per_minute=None, tokens_per_minute=None):
+    """
+    Estimates tokens, cost and wall time for enhancing the given chapters.
+
+    Args:
+        source: Chapter source (chapter_pack.DirectorySource or PackSource) holding the txt chapters
+        filenames (list): Chapter filenames selected for processing
+        base_prompt (str): Prompt template containing the placeholder
+        placeholder (str): Placeholder replaced by chapter text
+        input_price (float): Price per 1,000 input tokens
+        output_price (float): Price per 1,000 output tokens
+        concurrency (int): Effective number of concurrent calls
+        output_ratio (float): Expected output tokens per chapter input token
+        base_latency (float): Fixed per-call latency in seconds
+        output_tokens_per_second (float): Generation speed per call
+        requests_per_minute (int): Provider request rate limit, if any
+        tokens_per_minute (int): Provider token rate limit, if any
+
+    Returns:
+        dict: Plan totals
+    """
+    cache = load_plan_cache(source)
+    prompt_tokens = estimate_tokens(base_prompt.replace(placeholder, ""))
+
+    total_input = 0
+    total_output = 0
+    call_seconds = 0.0
+    for filename in filenames:
+        chapter_tokens = count_chapter_tokens(source, filename, cache)
+        output_tokens = int(chapter_tokens * output_ratio)
+        total_input += prompt_tokens + chapter_tokens
+        total_output += output_tokens
+        call_seconds += base_latency + output_tokens / output_tokens_per_second
+
+    save_plan_cache(source, cache)
+
+    # Wall time is bounded by concurrency and by whichever rate limit binds first
+    wall_seconds = call_seconds / max(1, concurrency)
+    if requests_per_minute:
+        wall_seconds = max(wall_seconds, len(filenames) / requests_per_minute * 60)
+    if tokens_per_minute:
+        wall_seconds = max(wall_seconds, (total_input + total_output) / tokens_per_minute * 60)
+
+    return {
+        "chapters": len(filenames),
+        "input_tokens": total_input,
+        "output_tokens": total_output,
+        "cost": (total_input / 1000) * input_price + (total_output / 1000) * output_price,
+        "wall_seconds": wall_seconds,
+    }
+
+
+def print_plan(plan, provider_name, concurrency):
+    print(f"\n--- Dry run plan ({provider_name}, concurrency {concurrency}) ---")
+    print(f"  Chapters          : {plan['chapters']}")
+    print(f"  Est. Input Tokens : {plan['input_tokens']}")
+    print(f"  Est. Output Tokens: {plan['output_tokens']}")
+    print(f"  Est. Cost         : ${plan['cost']:.4f}")
+    minutes, seconds = divmod(int(plan['wall_seconds']), 60)
+    hours, minutes = divmod(minutes, 60)
+    print(f"  Est. Wall Time    : {hours}h {minutes}m {seconds}s")
+    print(f"---------------------------")
@@ -1,6 +1,12 @@
 import os
-import json
 import re
+import argparse
+from chapter_titles import load_title_index
+from chapter_dedup import build_fingerprint_index, find_duplicates, print_duplicate_report
+from search_index import SearchIndex, chapter_number_from_filename
+from chapter_pack import open_chapter_source, PACK_SUFFIX
+from tracing import span, chapter_id
+from atomic_io import atomic_write
 
 def clean_text(text):
     """Clean up text content by removing redundant information and formatting"""
@@ -19,69 +25,126 @@ def clean_text(text):
     
     return text.strip()
 
-def export_chapters_to_txt(novel_title, chapters_dir, output_dir):
-    """Export chapter content to individual txt files"""
+def chapter_heading(chapter_file, chapter_title, title_index):
+    """Chapter title from the title index, falling back to the title stored with the chapter"""
+    stem = os.path.splitext(chapter_file)[0]
+    return title_index.get(stem) or chapter_title or 'Unknown Chapter'
+
+def base_dir_of(chapters_dir):
+    """Output directory that holds a novel's chapter directory (or .pack file)"""
+    return os.path.dirname(chapters_dir.rstrip('/'))
+
+def find_duplicate_chapters(chapters_dir):
+    """Chapter JSON files that duplicate an earlier chapter, with a report of what skipping them saves"""
+    source = open_chapter_source(chapters_dir)
+    index = build_fingerprint_index(source)
+    source.close()
+    duplicates = find_duplicates(index)
+    print_duplicate_report(index, duplicates)
+    return set(duplicates)
+
+def export_chapters_to_txt(novel_title, chapters_dir, output_dir, title_index=None, skip_files=(), search_index=None):
+    """
+    Export chapter content to individual txt files, except chapter files listed in skip_files
+    
+    chapters_dir may be a directory of chapter JSON files or a .pack file built by chapter_pack.py.
+    If search_index is given, exported chapters are also added to the full-text index, from the
+    same stored title and text the scraper indexes.
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    # Headings come from the chapter list, so no separate add_titles pass is needed
+    if title_index is None:
+        title_index = load_title_index(base_dir_of(chapters_dir), novel_title)
+    
     # Get all chapter files
-    chapter_files = sorted([f for f in os.listdir(chapters_dir) if f.startswith('chapter_') and f.endswith('.json')])
+    source = open_chapter_source(chapters_dir)
+    chapter_files = [f for f in source.names() if f not in skip_files]
     
     for chapter_file in chapter_files:
-        with open(os.path.join(chapters_dir, chapter_file), 'r', encoding='utf-8') as f:
-            chapter_data = json.load(f)
-        
-        # Create clean chapter text
-        chapter_text = f"# {chapter_data.get('title', 'Unknown Chapter')}\n\n"
-        chapter_text += clean_text(chapter_data.get('content_text', ''))
-        
-        # Save to txt file
-        output_file = os.path.join(output_dir, f"{chapter_file.replace('.json', '.txt')}")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(chapter_text)
-        
-        print(f"Exported: {output_file}")
+        with span('export', chapter_id(novel_title, chapter_file)) as export_span:
+            title, content_text, _ = source.read_chapter(chapter_file)
+            
+            # Create clean chapter text
+            chapter_text = f"# {chapter_heading(chapter_file, title, title_index)}\n\n"
+            chapter_text += clean_text(content_text)
+            
+            # Save to txt file
+            output_file = os.path.join(output_dir, f"{chapter_file.replace('.json', '.txt')}")
+            with atomic_write(output_file) as f:
+                f.write(chapter_text)
+            
+            print(f"Exported: {output_file}")
+            
+            if search_index is not None:
+                # Indexed exactly as the scraper indexes it (stored title and content_text), so
+                # the content hash matches and an unchanged chapter isn't re-indexed
+                search_index.add_chapter(novel_title, chapter_number_from_filename(chapter_file), title, content_text)
+            export_span['bytes'] = len(chapter_text.encode('utf-8'))
     
+    source.close()
+    if search_index is not None:
+        search_index.commit()
     print(f"Exported {len(chapter_files)} chapters to {output_dir}")
 
-def export_novel_to_single_file(novel_title, chapters_dir, output_dir):
-    """Export all chapters to a single text file"""
+def export_novel_to_single_file(novel_title, chapters_dir, output_dir, title_index=None, skip_files=()):
+    """Export all chapters (except those listed in skip_files) to a single text file"""
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    if title_index is None:
+        title_index = load_title_index(base_dir_of(chapters_dir), novel_title)
+    
     # Get all chapter files
-    chapter_files = sorted([f for f in os.listdir(chapters_dir) if f.startswith('chapter_') and f.endswith('.json')])
+    source = open_chapter_source(chapters_dir)
+    chapter_files = [f for f in source.names() if f not in skip_files]
     
     # Create file for the whole novel
     output_file = os.path.join(output_dir, f"{novel_title}_full.txt")
     
-    with open(output_file, 'w', encoding='utf-8') as out_f:
+    with atomic_write(output_file) as out_f:
         # Write novel title
         out_f.write(f"# {novel_title}\n\n")
         
         for chapter_file in chapter_files:
-            with open(os.path.join(chapters_dir, chapter_file), 'r', encoding='utf-8') as f:
-                chapter_data = json.load(f)
+            title, content_text, _ = source.read_chapter(chapter_file)
             
             # Create clean chapter text
-            chapter_text = f"## {chapter_data.get('title', 'Unknown Chapter')}\n\n"
-            chapter_text += clean_text(chapter_data.get('content_text', ''))
+            chapter_text = f"## {chapter_heading(chapter_file, title, title_index)}\n\n"
+            chapter_text += clean_text(content_text)
             chapter_text += "\n\n" + "-" * 50 + "\n\n"
             
             # Write to the output file
             out_f.write(chapter_text)
     
+    source.close()
     print(f"Exported all chapters to: {output_file}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export scraped chapters to txt files')
+    parser.add_argument('--skip-duplicates', action='store_true', help='Do not export chapters that duplicate an earlier chapter')
+    parser.add_argument('--no-index', action='store_true', help='Do not update the full-text search index')
+    parser.add_argument('--from-pack', action='store_true', help='Read chapters from output/<novel>_chapters.pack instead of the chapter directory')
+    args = parser.parse_args()
+    
     # Set up paths
     novel_title = "mục_thần_ký"
     base_dir = "output"
     chapters_dir = os.path.join(base_dir, f"{novel_title}_chapters")
+    if args.from_pack:
+        chapters_dir += PACK_SUFFIX
     txt_output_dir = os.path.join(base_dir, f"{novel_title}_txt")
     
-    # Export to individual files
-    export_chapters_to_txt(novel_title, chapters_dir, txt_output_dir)
+    # Build the chapter title index once for both exports
+    title_index = load_title_index(base_dir, novel_title)
+    skip_files = find_duplicate_chapters(chapters_dir) if args.skip_duplicates else set()
+    
+    # Export to individual files, updating the search index as chapters are written
+    search_index = None if args.no_index else SearchIndex()
+    export_chapters_to_txt(novel_title, chapters_dir, txt_output_dir, title_index, skip_files, search_index)
+    if search_index is not None:
+        search_index.close()
     
     # Export to a single file
-    export_novel_to_single_file(novel_title, chapters_dir, txt_output_dir) 
\ No newline at end of file
+    export_novel_to_single_file(novel_title, chapters_dir, txt_output_dir, title_index, skip_files) 
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""
+Single-flight page fetches with a short-lived in-memory cache.
+
+The novel page, the listchap API pages and the chapter pages all go through
+page_cache, keyed on the absolute URL (relative links are joined against the
+site's base URL, fragments dropped). Concurrent requests for the same URL wait
+for the one already in flight instead of sending their own, and responses are
+kept in a small LRU for the rest of the run, so no page is downloaded twice
+per crawl even when the HTML fallbacks and the API list the same chapter.
+
+Failed fetches are not cached: the next caller fetches the URL again.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit
+
+BASE_URL = "https://wikidich.vn"
+MAX_ENTRIES = 128 # Chapter pages are ~50-100 KB, so at most a few MB held
+# Long enough to cover one crawl's repeated requests (e.g. the update daemon's
+# count check followed by the chapter list download), shorter than any polling interval
+TTL_SECONDS = 300
+
+
+def normalize_url(url, base_url=BASE_URL):
+    """Absolute URL with a lower-case host and no fragment, used as the cache key"""
+    scheme, netloc, path, query, _ = urlsplit(urldefrag(urljoin(base_url, url.strip())).url)
+    return urlunsplit((scheme.lower(), netloc.lower(), path or '/', query, ''))
+
+
+class FetchCache:
+    """
+    Thread-safe single-flight fetch layer.
+
+    get() runs the given fetch function at most once per URL at a time; callers
+    arriving while it runs share its result (or its exception). Successful
+    results stay cached for TTL_SECONDS, least recently used evicted first.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # url -> (fetched at, result)
+        self.in_flight = {} # url -> Future of the fetch running for it
+        self.fetches = 0
+        self.hits = 0
+        self.coalesced = 0
+
+    def get(self, url, fetch, base_url=BASE_URL):
+        """
+        Result of fetch(normalized url), from the cache or a fetch already in flight when possible
+
+        Args:
+            url (str): Absolute or relative URL
+            fetch (callable): absolute URL -> result (e.g. a requests.Response); exceptions propagate
+            base_url (str): Base for relative URLs
+
+        Returns:
+            The fetch result, shared with every other caller of the same URL
+        """
+        url = normalize_url(url, base_url)
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.entries.move_to_end(url)
+                self.hits += 1
+                return entry[1]
+            call = self.in_flight.get(url)
+            leader = call is None
+            if leader:
+                call = self.in_flight[url] = Future()
+                self.fetches += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = fetch(url)
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[url]
+            call.set_exception(e)
+            raise
+        with self.lock:
+            del self.in_flight[url]
+            self.entries[url] = (time.monotonic(), result)
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        call.set_result(result)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return f"{self.fetches} fetched, {self.hits} from cache, {self.coalesced} joined a fetch in flight"
+
+
+page_cache = FetchCache()
@@ -0,0 +1,238 @@
+import asyncio
+import time
+from collections import deque
+
+# Number of successful calls a provider needs before its latency percentile is trusted for hedging
+MIN_LATENCY_SAMPLES = 5
+LATENCY_WINDOW = 200 # Keep only the most recent latencies per provider
+FAILURE_THRESHOLD = 3 # Consecutive failures before a provider is put on cooldown
+
+
+class ProviderError(Exception):
+    """Raised when a provider call fails or returns no usable content."""
+
+
+class LLMProvider:
+    """
+    Base class for an LLM backend.
+
+    Each provider has its own concurrency limit, pricing (per 1,000 tokens) and
+    a rolling window of observed latencies used to decide when to hedge.
+    """
+    name = "base"
+
+    def __init__(self, model, input_price, output_price, concurrency=10, cooldown_seconds=30):
+        self.model = model
+        self.input_price = input_price
+        self.output_price = output_price
+        self.concurrency = concurrency
+        self.cooldown_seconds = cooldown_seconds
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # Created lazily so the semaphore binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def cost(self, input_tokens, output_tokens):
+        """Estimated cost in USD for a call with the given token usage."""
+        return (input_tokens / 1000) * self.input_price + (output_tokens / 1000) * self.output_price
+
+    def is_available(self):
+        """False while the provider is cooling down after repeated failures."""
+        return time.monotonic() >= self.cooldown_until
+
+    def latency_percentile(self, percentile):
+        """Observed latency (seconds) at the given percentile, or None if there are too few samples."""
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def record_success(self, latency):
+        self.latencies.append(latency)
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= FAILURE_THRESHOLD:
+            self.cooldown_until = time.monotonic() + self.cooldown_seconds
+            print(f"[{self.name}] {self.consecutive_failures} consecutive failures, cooling down for {self.cooldown_seconds}s")
+
+    async def complete(self, prompt_text, started=None):
+        """
+        Runs one completion under the provider's concurrency limit.
+
+        `started` (an asyncio.Event) is set once a concurrency slot is acquired,
+        so callers can time the request itself rather than the queueing.
+        Returns (text, input_tokens, output_tokens).
+        """
+        async with self.semaphore:
+            if started is not None:
+                started.set()
+            start = time.monotonic()
+            try:
+                text, input_tokens, output_tokens = await self._complete(prompt_text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.record_failure()
+                raise ProviderError(f"{self.name}: {e}") from e
+            if not text:
+                self.record_failure()
+                raise ProviderError(f"{self.name}: response did not contain any content")
+            self.record_success(time.monotonic() - start)
+            return text, input_tokens, output_tokens
+
+    async def _complete(self, prompt_text):
+        raise NotImplementedError
+
+
+class DeepSeekProvider(LLMProvider):
+    """DeepSeek via its OpenAI-compatible API."""
+    name = "deepseek"
+
+    def __init__(self, api_key, base_url, model, input_price, output_price, temperature=None, **kwargs):
+        super().__init__(model, input_price, output_price, **kwargs)
+        self.temperature = temperature
+        import openai # Imported lazily: only needed once a DeepSeek provider is actually built
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+    async def _complete(self, prompt_text):
+        params = {"model": self.model, "messages": [{"role": "user", "content": prompt_text}]}
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        response = await self.client.chat.completions.create(**params)
+        input_tokens = response.usage.prompt_tokens if response.usage else 0
+        output_tokens = response.usage.completion_tokens if response.usage else 0
+        text = response.choices[0].message.content if response.choices and response.choices[0].message else None
+        return text, input_tokens, output_tokens
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini via google-generativeai."""
+    name = "gemini"
+
+    def __init__(self, api_key, model, input_price, output_price, **kwargs):
+        super().__init__(model, input_price, output_price, **kwargs)
+        import google.generativeai as genai # Imported lazily: slow to import and rarely used
+        genai.configure(api_key=api_key)
+        self.client = genai.GenerativeModel(model)
+
+    async def _complete(self, prompt_text):
+        response = await self.client.generate_content_async(prompt_text)
+        input_tokens = 0
+        output_tokens = 0
+        if response.usage_metadata:
+            input_tokens = response.usage_metadata.prompt_token_count
+            output_tokens = response.usage_metadata.candidates_token_count
+        if not response.parts:
+            raise ProviderError(f"response did not contain parts, prompt feedback: {response.prompt_feedback}")
+        return response.text, input_tokens, output_tokens
+
+
+class ProviderPool:
+    """
+    Routes completions across several providers.
+
+    The first available provider is tried first. If it has not answered within
+    its own latency percentile (`hedge_percentile`), a hedged request is fired
+    at the next available provider and whichever answers first wins. Errors
+    fail over to the remaining providers; when every provider has failed the
+    whole round is retried after `retry_delay` seconds.
+    """
+
+    def __init__(self, providers, hedge_percentile=95, max_retries=3, retry_delay=30):
+        if not providers:
+            raise ValueError("ProviderPool needs at least one provider")
+        self.providers = list(providers)
+        self.hedge_percentile = hedge_percentile
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def get(self, name):
+        for provider in self.providers:
+            if provider.name == name:
+                return provider
+        raise KeyError(name)
+
+    def _candidates(self):
+        available = [p for p in self.providers if p.is_available()]
+        # If everything is cooling down, still try in configured order rather than stalling
+        return available or list(self.providers)
+
+    async def complete(self, prompt_text, label=""):
+        """
+        Returns (text, input_tokens, output_tokens, provider_name).
+
+        Raises ProviderError once all retries across all providers are exhausted.
+        """
+        last_error = None
+        for attempt in range(self.max_retries):
+            pending = self._candidates()
+            while pending:
+                primary = pending.pop(0)
+                try:
+                    result = await self._complete_hedged(primary, pending, prompt_text, label)
+                    print(f"[{label}] {result[3]} call successful (Attempt {attempt + 1}/{self.max_retries}).")
+                    return result
+                except ProviderError as e:
+                    last_error = e
+                    print(f"[{label}] Error during API call (Attempt {attempt + 1}/{self.max_retries}): {e}")
+                    if pending:
+                        print(f"[{label}] Failing over to {pending[0].name}...")
+            if attempt < self.max_retries - 1:
+                print(f"[{label}] All providers failed. Retrying in {self.retry_delay} seconds...")
+                await asyncio.sleep(self.retry_delay)
+        print(f"[{label}] Max retries reached. Giving up.")
+        raise ProviderError(str(last_error))
+
+    async def _complete_hedged(self, primary, backups, prompt_text, label):
+        """Calls `primary`, hedging with the first of `backups` if it exceeds its latency percentile."""
+        print(f"[{label}] Calling {primary.name} API ({primary.model})... Length: {len(prompt_text)}")
+        started = asyncio.Event()
+        primary_task = asyncio.ensure_future(self._named(primary, prompt_text, started))
+        hedge_after = primary.latency_percentile(self.hedge_percentile) if self.hedge_percentile else None
+        if hedge_after is None or not backups:
+            return await primary_task
+
+        # Only start the hedge clock once the primary request is actually in flight
+        started_task = asyncio.ensure_future(started.wait())
+        await asyncio.wait({primary_task, started_task}, return_when=asyncio.FIRST_COMPLETED)
+        started_task.cancel()
+        done, _ = await asyncio.wait({primary_task}, timeout=hedge_after)
+        if done:
+            return primary_task.result()
+
+        hedge = backups.pop(0)
+        self.hedges_fired += 1
+        print(f"[{label}] {primary.name} slower than p{self.hedge_percentile} ({hedge_after:.1f}s), hedging with {hedge.name}...")
+        hedge_task = asyncio.ensure_future(self._named(hedge, prompt_text))
+        tasks = {primary_task, hedge_task}
+        last_error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.hedges_won += 1
+                        return task.result()
+                    last_error = task.exception()
+        finally:
+            # Cancel the slower request once we have an answer
+            for task in tasks:
+                task.cancel()
+        raise last_error
+
+    async def _named(self, provider, prompt_text, started=None):
+        text, input_tokens, output_tokens = await provider.complete(prompt_text, started)
+        return text, input_tokens, output_tokens, provider.name
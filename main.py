@@ -2,30 +2,41 @@
 import argparse
 import os
 import sys
-from wikidich_scraper import scrape_wikidich_novel, save_to_json, save_to_csv
-from chapter_scraper import scrape_all_chapters
+from wikidich_scraper import scrape_wikidich_novel, save_to_json, save_novel_info
+from chapter_scraper import scrape_all_chapters, load_saved_chapters
+from search_index import SearchIndex
+from proxy_pool import build_pool, DEFAULT_RPM
+from fetch_cache import page_cache
+from chapter_catalog import update_novel
 
 def main():
     parser = argparse.ArgumentParser(description='Scrape novels from wikidich.vn')
     parser.add_argument('--info-only', action='store_true', help='Only scrape novel info and chapter list without downloading content')
     parser.add_argument('--max-pages', type=int, default=19, help='Maximum number of pages to scrape')
     parser.add_argument('--chapters', type=int, default=3, help='Number of chapters to download content (use -1 for all chapters)')
+    parser.add_argument('--no-index', action='store_true', help='Do not add downloaded chapters to the full-text search index')
+    parser.add_argument('--proxies', metavar='FILE', help='Spread requests over the exits listed in FILE (see proxy_pool.py)')
+    parser.add_argument('--proxy-rpm', type=float, default=DEFAULT_RPM, help=f'Requests per minute per exit when not set in the proxy file (default: {DEFAULT_RPM})')
+    parser.add_argument('--jobs', type=int, default=None, help='Chapters fetched concurrently with --proxies (default: 2 per exit)')
+    parser.add_argument('--catalog', action='store_true', help='Update the chapter catalogue (output/catalog, needs pyarrow) after scraping')
+    parser.add_argument('--parse-workers', type=int, default=None, help='Processes parsing fetched chapters when fetching concurrently (default: one per CPU, 0 to parse on the fetch threads)')
     args = parser.parse_args()
     
     url = "https://wikidich.vn/muc-than-ky-convert"
     
+    pool = None
+    if args.proxies:
+        pool = build_pool(args.proxies, args.proxy_rpm)
+        pool.check_health(url)
+        print(f"{pool.healthy_count()}/{len(pool)} exits healthy")
+        pool.print_stats()
+    
     print(f"Scraping novel from: {url}")
-    novel_data = scrape_wikidich_novel(url, follow_pagination=True, max_pages=args.max_pages)
+    novel_data = scrape_wikidich_novel(url, follow_pagination=True, max_pages=args.max_pages, pool=pool)
     
     if novel_data:
-        # Create output directory if it doesn't exist
-        if not os.path.exists('output'):
-            os.makedirs('output')
-            
         # Save the data
-        title = novel_data.get('title', 'unknown').replace(' ', '_').lower()
-        save_to_json(novel_data, f"output/{title}_info.json")
-        save_to_csv(novel_data, f"output/{title}_chapters.csv")
+        title = save_novel_info(novel_data, 'output')
         
         # If not info-only, download chapter content
         if not args.info_only and args.chapters != 0:
@@ -38,20 +49,36 @@ def main():
                 chapters_to_download = novel_data['chapters']
             
             # Scrape chapter content
+            search_index = None if args.no_index else SearchIndex()
             updated_chapters = scrape_all_chapters(
                 novel_data,
                 specific_chapters=chapters_to_download,
                 output_dir='output',
-                delay=1.0  # 1 second delay between requests
+                delay=1.0,  # 1 second delay between requests
+                search_index=search_index,
+                pool=pool,
+                jobs=args.jobs or (2 * len(pool) if pool else 1),
+                parse_workers=args.parse_workers
             )
+            if search_index is not None:
+                search_index.close()
             
-            # Update the novel data with chapter content
+            # Update the novel data with chapter content (including chapters completed by an earlier run)
             novel_data['chapters'] = updated_chapters
+            load_saved_chapters(novel_data, 'output', count=len(chapters_to_download))
             
             # Save the complete data with content
             save_to_json(novel_data, f"output/{title}_complete.json")
             print(f"Complete data with chapter content saved to: output/{title}_complete.json")
         
+        if args.catalog:
+            try:
+                rows, read = update_novel(title, 'output')
+                print(f"Catalogue updated: {rows} chapters, {read} chapter files read")
+            except RuntimeError as e:
+                print(f"Catalogue not updated: {e}")
+        
+        print(f"Pages: {page_cache.stats()}")
         print("\nScraping completed successfully!")
         print(f"Novel information saved to: output")
     else:
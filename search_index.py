@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from array import array
+
+DEFAULT_INDEX_PATH = 'output/search_index.sqlite'
+MAX_CANDIDATE_FILTER = 500 # Narrow later term lookups to the docs matched so far when there are at most this many
+SNIPPET_WORDS = 12 # Words of context on each side of a match
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+# Query syntax: "quoted phrase", prefix*, or plain word (all parts must match)
+QUERY_PATTERN = re.compile(r'"([^"]+)"|(\S+)')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    novel TEXT NOT NULL,
+    chapter INTEGER NOT NULL,
+    title TEXT,
+    content_hash TEXT NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (novel, chapter)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+'''
+
+
+def fold(text):
+    """Lowercase and strip Vietnamese diacritics, so 'Mục Thần' and 'muc than' index the same"""
+    text = text.lower().replace('đ', 'd')
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Folded terms in document order"""
+    return [fold(word) for word in WORD_PATTERN.findall(text)]
+
+
+def parse_query(query):
+    """
+    Split a query into parts that must all match.
+
+    Each part is a list of (term, is_prefix) pairs that must occur consecutively:
+    a "quoted phrase" gives several pairs, a plain word one; a trailing * marks a prefix.
+    """
+    parts = []
+    for phrase, word in QUERY_PATTERN.findall(query):
+        terms = []
+        for raw in (phrase.split() if phrase else [word]):
+            words = WORD_PATTERN.findall(raw)
+            terms += [(fold(w), False) for w in words]
+            if words and raw.endswith('*'):
+                terms[-1] = (terms[-1][0], True)
+        if terms:
+            parts.append(terms)
+    return parts
+
+
+def chapter_number_from_filename(filename):
+    match = re.search(r'chapter_(\d+)', filename)
+    return int(match.group(1)) if match else None
+
+
+class SearchIndex:
+    """
+    On-disk inverted index over chapter texts, stored in SQLite.
+
+    Each term maps to the chapters containing it with the word positions of
+    every occurrence, which supports phrase queries; prefix queries are range
+    scans over the sorted term column.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def add_chapter(self, novel, chapter, title, text):
+        """
+        Index (or re-index) one chapter. Unchanged chapters are skipped by content hash.
+
+        Returns:
+            bool: True if the chapter was (re)indexed
+        """
+        content_hash = hashlib.sha1(f"{title}\n{text}".encode('utf-8')).hexdigest()
+        row = self.conn.execute('SELECT id, content_hash FROM docs WHERE novel = ? AND chapter = ?', (novel, chapter)).fetchone()
+        if row and row[1] == content_hash:
+            return False
+        if row:
+            self.conn.execute('DELETE FROM postings WHERE doc_id = ?', (row[0],))
+            self.conn.execute('UPDATE docs SET title = ?, content_hash = ?, text = ? WHERE id = ?', (title, content_hash, text, row[0]))
+            doc_id = row[0]
+        else:
+            doc_id = self.conn.execute('INSERT INTO docs (novel, chapter, title, content_hash, text) VALUES (?, ?, ?, ?, ?)',
+                                       (novel, chapter, title, content_hash, text)).lastrowid
+
+        positions = {}
+        for position, term in enumerate(tokenize(f"{title}\n{text}")):
+            positions.setdefault(term, array('I')).append(position)
+        self.conn.executemany('INSERT INTO postings (term, doc_id, positions) VALUES (?, ?, ?)',
+                              [(term, doc_id, pos.tobytes()) for term, pos in positions.items()])
+        return True
+
+    def _term_postings(self, term, prefix=False, novel=None, doc_ids=None):
+        """doc_id -> set of positions for a term (or every term starting with it), optionally within doc_ids"""
+        sql = 'SELECT p.doc_id, p.positions FROM postings p'
+        params = []
+        if novel:
+            sql += ' JOIN docs d ON d.id = p.doc_id'
+        if prefix:
+            sql += ' WHERE p.term >= ? AND p.term < ?'
+            params += [term, term + '\uffff']
+        else:
+            sql += ' WHERE p.term = ?'
+            params.append(term)
+        if novel:
+            sql += ' AND d.novel = ?'
+            params.append(novel)
+        if doc_ids is not None and len(doc_ids) <= MAX_CANDIDATE_FILTER:
+            sql += f" AND p.doc_id IN ({','.join('?' * len(doc_ids))})"
+            params += list(doc_ids)
+
+        result = {}
+        for doc_id, blob in self.conn.execute(sql, params):
+            positions = array('I')
+            positions.frombytes(blob)
+            result.setdefault(doc_id, set()).update(positions)
+        return result
+
+    def _match_part(self, terms, novel, candidates=None):
+        """doc_id -> start positions where the term sequence (a phrase, or a single word) occurs"""
+        matches = None
+        for offset, (term, prefix) in enumerate(terms):
+            postings = self._term_postings(term, prefix, novel, candidates if matches is None else matches.keys())
+            if matches is None:
+                matches = postings
+                continue
+            narrowed = {}
+            for doc_id, starts in matches.items():
+                if doc_id in postings:
+                    kept = {start for start in starts if start + offset in postings[doc_id]}
+                    if kept:
+                        narrowed[doc_id] = kept
+            matches = narrowed
+            if not matches:
+                break
+        return matches or {}
+
+    def search(self, query, novel=None, limit=20):
+        """
+        Search the index.
+
+        Args:
+            query (str): Words, "quoted phrases" and prefix* terms; all must match
+            novel (str): Restrict to one novel
+            limit (int): Maximum results
+
+        Returns:
+            list: dicts with novel, chapter, title, snippet, hits; most hits first
+        """
+        parts = parse_query(query)
+        if not parts:
+            return []
+        matches = None
+        first_part = None
+        for terms in parts:
+            part_matches = self._match_part(terms, novel, None if matches is None else matches.keys())
+            if matches is None:
+                matches, first_part = part_matches, terms
+            else:
+                matches = {doc_id: starts for doc_id, starts in matches.items() if doc_id in part_matches}
+            if not matches:
+                return []
+
+        # Rank on the posting data alone and only load text for the results actually returned
+        ranked = sorted(matches.items(), key=lambda item: (-len(item[1]), item[0]))[:limit]
+        results = []
+        for doc_id, starts in ranked:
+            novel_name, chapter, title, text = self.conn.execute(
+                'SELECT novel, chapter, title, text FROM docs WHERE id = ?', (doc_id,)).fetchone()
+            results.append({
+                'novel': novel_name,
+                'chapter': chapter,
+                'title': title,
+                'hits': len(starts),
+                'snippet': make_snippet(f"{title}\n{text}", min(starts), len(first_part)),
+            })
+        return results
+
+
+def make_snippet(text, position, length):
+    """Original (non-folded) text around the word at `position`, with the match in [brackets]"""
+    words = list(WORD_PATTERN.finditer(text))
+    if position >= len(words):
+        return ''
+    start = words[max(0, position - SNIPPET_WORDS)].start()
+    end = words[min(len(words) - 1, position + length - 1 + SNIPPET_WORDS)].end()
+    match_start = words[position].start()
+    match_end = words[min(len(words) - 1, position + length - 1)].end()
+    snippet = f"{text[start:match_start]}[{text[match_start:match_end]}]{text[match_end:end]}"
+    return ('…' if start > 0 else '') + ' '.join(snippet.split()) + ('…' if end < len(text) else '')
+
+
+def index_chapters_dir(index, novel, chapters_dir):
+    """Index every chapter JSON in a directory, returns the number of chapters (re)indexed"""
+    updated = 0
+    for filename in sorted(os.listdir(chapters_dir)):
+        number = chapter_number_from_filename(filename)
+        if number is None or not filename.endswith('.json'):
+            continue
+        with open(os.path.join(chapters_dir, filename), 'r', encoding='utf-8') as f:
+            chapter_data = json.load(f)
+        if index.add_chapter(novel, number, chapter_data.get('title', ''), chapter_data.get('content_text', '')):
+            updated += 1
+    index.commit()
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text search over scraped chapters')
+    parser.add_argument('query', nargs='*', help='Words, "quoted phrases" and prefix* terms (several arguments are joined)')
+    parser.add_argument('--novel', help='Restrict to one novel (e.g. mục_thần_ký)')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum results (default: 20)')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help=f'Index file (default: {DEFAULT_INDEX_PATH})')
+    parser.add_argument('--build', metavar='OUTPUT_DIR', help='Index every <novel>_chapters directory under OUTPUT_DIR (incremental)')
+    args = parser.parse_args()
+
+    if not args.query and not args.build:
+        parser.error('give a query or --build')
+
+    with SearchIndex(args.index) as index:
+        if args.build:
+            for name in sorted(os.listdir(args.build)):
+                chapters_dir = os.path.join(args.build, name)
+                if name.endswith('_chapters') and os.path.isdir(chapters_dir):
+                    novel = name[:-len('_chapters')]
+                    print(f"Indexed {index_chapters_dir(index, novel, chapters_dir)} chapters of {novel}")
+
+        if args.query:
+            start = time.perf_counter()
+            results = index.search(' '.join(args.query), args.novel, args.limit)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            for result in results:
+                print(f"{result['novel']} chương {result['chapter']} ({result['hits']} hits): {result['title']}")
+                print(f"    {result['snippet']}")
+            print(f"{len(results)} results in {elapsed_ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
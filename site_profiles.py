@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Declarative per-site extraction profiles and the selectors learned from them.
+
+A profile lists, for each field, CSS selectors to try in order. The first
+selector that produces a usable result on a site is remembered in
+output/site_selectors.json and tried ahead of every selector ranked below it on
+later pages of that site, so a chapter normally costs one lookup per field; the
+rest of the list is only walked when the remembered selector stops working.
+Selectors ranked above the remembered one are still tried before it, and one
+that matches replaces it straight away, while a selector ranked lower only
+takes over after the remembered one failed on RELEARN_AFTER pages in a row. So
+one odd page (an author's note, a notice) can't make a broad selector like
+'main' the site's content selector.
+
+New sites can be added without code changes by putting a profile in
+site_profiles.json (same keys as DEFAULT_PROFILE, missing keys are inherited):
+
+    {
+        "example.com": {
+            "title": ["h1.entry-title"],
+            "content": ["div#chapter-body"]
+        }
+    }
+"""
+import argparse
+import json
+import re
+import threading
+from urllib.parse import urlparse
+from atomic_io import write_json
+
+PROFILES_FILE = 'site_profiles.json'
+LEARNED_FILE = 'output/site_selectors.json'
+# tag, tag.class, .class or #id: looked up with find(), which is several times faster than CSS matching
+SIMPLE_SELECTOR = re.compile(r'^([a-zA-Z][\w-]*)?(?:\.([\w-]+)|#([\w-]+))?$')
+# Consecutive pages the learned selector must fail on before a lower-ranked one replaces it
+RELEARN_AFTER = 3
+
+DEFAULT_PROFILE = {
+    'title': ['h1.chapter-title', 'h1', 'h2.chapter-title', 'h2'],
+    'content': ['div.chapter-content', 'div.entry-content', 'div.content', 'div.truyen', 'article', 'main'],
+    'chapter_list': ['#chapter-list'],
+    'strip': ['script', 'style', 'ins', 'iframe', 'ads'], # Removed from the content element before reading it
+    'min_content_chars': 100, # A content element must have more text than this
+}
+
+SITE_PROFILES = {
+    'wikidich.vn': {}, # The default selectors were written for wikidich
+}
+
+
+def site_of(url):
+    """Host of a URL without 'www.', used as the profile key"""
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def select_one(soup, selector):
+    """First element matching a CSS selector"""
+    match = SIMPLE_SELECTOR.match(selector)
+    if not match:
+        return soup.select_one(selector)
+    tag, class_name, element_id = match.groups()
+    attrs = {}
+    if class_name:
+        attrs['class_'] = class_name
+    if element_id:
+        attrs['id'] = element_id
+    return soup.find(tag or True, **attrs)
+
+
+def load_profiles(path=PROFILES_FILE):
+    """Built-in profiles merged with the ones in site_profiles.json, if it exists"""
+    profiles = {site: dict(profile) for site, profile in SITE_PROFILES.items()}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for site, profile in json.load(f).items():
+                profiles.setdefault(site, {}).update(profile)
+    except FileNotFoundError:
+        pass
+    return profiles
+
+
+class SelectorCache:
+    """
+    Winning selector per (site, field), persisted as JSON.
+
+    Thread-safe: chapter fetches may run on a thread pool. The file is only
+    rewritten when a winner changes, which after the first page is rare.
+    """
+
+    def __init__(self, path=LEARNED_FILE, profiles_path=PROFILES_FILE):
+        self.path = path
+        self.profiles_path = profiles_path
+        self.lock = threading.Lock()
+        self.learned = None
+        self.profiles = None
+        self.hits = 0
+        self.misses = 0
+        self.streaks = {} # (site, field) -> consecutive pages the learned selector failed on
+
+    def _load(self):
+        if self.learned is not None:
+            return
+        self.profiles = load_profiles(self.profiles_path)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.learned = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.learned = {}
+
+    def profile(self, site):
+        with self.lock:
+            self._load()
+            return {**DEFAULT_PROFILE, **self.profiles.get(site, {})}
+
+    def get(self, site, field):
+        with self.lock:
+            self._load()
+            return self.learned.get(site, {}).get(field)
+
+    def observe(self, site, field, selector):
+        """
+        Learns from the selector that won on one page (None if none did)
+
+        A winner ranked above the learned selector replaces it straight away; one
+        ranked below only after the learned selector failed RELEARN_AFTER pages in a row.
+        """
+        with self.lock:
+            self._load()
+            learned = self.learned.get(site, {}).get(field)
+            if selector == learned:
+                self.hits += 1
+                self.streaks.pop((site, field), None)
+                return
+            self.misses += 1
+            if selector is None:
+                return
+            ranking = {**DEFAULT_PROFILE, **self.profiles.get(site, {})}[field]
+            if learned in ranking and (selector not in ranking or ranking.index(selector) > ranking.index(learned)):
+                streak = self.streaks.get((site, field), 0) + 1
+                self.streaks[(site, field)] = streak
+                if streak < RELEARN_AFTER:
+                    return
+            self.streaks.pop((site, field), None)
+            self.learned.setdefault(site, {})[field] = selector
+            write_json(self.path, self.learned, indent=2)
+        print(f"  Learned {field} selector for {site}: {selector}")
+
+    def forget(self, site=None):
+        """Drops learned selectors for one site (or all), e.g. after a site redesign"""
+        with self.lock:
+            self._load()
+            if site:
+                self.learned.pop(site, None)
+            else:
+                self.learned = {}
+            write_json(self.path, self.learned, indent=2)
+
+
+learned_selectors = SelectorCache()
+
+
+def extract(soup, site, field, read, cache=None, winners=None):
+    """
+    Finds a field on a page using the site's learned selector, falling back to its profile
+
+    Args:
+        soup (BeautifulSoup): Parsed page
+        site (str): Profile key, see site_of()
+        field (str): Profile field, e.g. 'title' or 'content'
+        read (callable): element -> extracted value, or None if the element is not usable
+        cache (SelectorCache): Defaults to the shared learned_selectors
+        winners (dict): For a process that doesn't own the cache (a parse worker): the learned
+            selectors (field -> selector) passed in by the owner, used instead of the cache's own.
+            The selector that won (or None) is stored under winners[field] instead of being
+            learned, for the owner to observe()
+
+    Returns:
+        tuple: (selector, value), or (None, None) if no selector produced a value
+    """
+    cache = cache or learned_selectors
+    observe = cache.observe if winners is None else lambda site, field, selector: winners.__setitem__(field, selector)
+    learned = cache.get(site, field) if winners is None else winners.get(field)
+    selectors = cache.profile(site)[field]
+    if learned:
+        # The learned selector goes ahead of the selectors ranked below it, not of those above
+        # it: a broad selector learned from an odd page must not hide a better one that matches
+        rank = selectors.index(learned) if learned in selectors else 0
+        selectors = selectors[:rank] + [learned] + [selector for selector in selectors[rank:] if selector != learned]
+
+    for selector in selectors:
+        element = select_one(soup, selector)
+        value = read(element) if element is not None else None
+        if value is not None:
+            observe(site, field, selector)
+            return selector, value
+    observe(site, field, None)
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show or reset learned extraction selectors')
+    parser.add_argument('--forget', metavar='SITE', nargs='?', const='', help='Forget learned selectors for SITE (all sites if omitted)')
+    args = parser.parse_args()
+
+    if args.forget is not None:
+        learned_selectors.forget(args.forget or None)
+        print(f"Forgot learned selectors for {args.forget or 'all sites'}")
+        return
+    learned_selectors._load()
+    for site, fields in sorted(learned_selectors.learned.items()):
+        print(f"{site}:")
+        for field, selector in sorted(fields.items()):
+            print(f"  {field}: {selector}")
+    for site in sorted(learned_selectors.profiles):
+        if site not in learned_selectors.learned:
+            print(f"{site}: profile only, nothing learned yet")
+
+
+if __name__ == '__main__':
+    main()
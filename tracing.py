@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Per-chapter lifecycle tracing.
+
+Every stage a chapter passes through (fetch, parse, save, export, titles,
+enhance, upload) appends one span record to a JSONL trace file:
+
+    {"chapter": "mục_thần_ký/chapter_0001", "stage": "fetch", "start": 1718000000.12,
+     "end": 1718000001.52, "outcome": "ok", "bytes": 48211, "pid": 4242}
+
+plus stage-specific fields such as input_tokens/output_tokens for enhance.
+Spans of one chapter share a trace ID derived from the chapter ID, so they
+line up as one trace even though the stages run as separate commands.
+
+    python tracing.py report [--top 10]
+    python tracing.py export-otlp [--output trace.otlp.json] [--endpoint http://localhost:4318/v1/traces]
+
+Set CHAPTER_TRACE_FILE to change the trace file, or to an empty string to turn tracing off.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_TRACE_FILE = 'output/trace.jsonl'
+TRACE_FILE = os.getenv('CHAPTER_TRACE_FILE', DEFAULT_TRACE_FILE)
+STAGE_ORDER = ['fetch', 'parse', 'save', 'export', 'titles', 'enhance', 'upload']
+SERVICE_NAME = 'wikidich-scraper'
+
+_lock = threading.Lock()
+
+
+def chapter_id(novel, filename):
+    """Chapter ID shared by every stage, e.g. 'mục_thần_ký/chapter_0001'"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return f"{novel}/{stem}" if novel else stem
+
+
+def record(span_record, path=None):
+    """Appends one span record to the trace file (one write per line, so concurrent writers don't interleave)"""
+    path = TRACE_FILE if path is None else path
+    if not path:
+        return
+    line = json.dumps(span_record, ensure_ascii=False) + '\n'
+    with _lock:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+@contextmanager
+def span(stage, chapter, **fields):
+    """
+    Times a stage of one chapter and records it on exit
+
+    The yielded dict can be updated with bytes, tokens or outcome while the stage runs;
+    an exception marks the span as an error and is re-raised.
+    """
+    span_record = {'chapter': chapter, 'stage': stage, 'start': time.time(), 'outcome': 'ok', **fields}
+    try:
+        yield span_record
+    except BaseException as e:
+        span_record['outcome'] = 'error'
+        span_record['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span_record['end'] = time.time()
+        span_record['pid'] = os.getpid()
+        record(span_record)
+
+
+def record_span(stage, chapter, start, outcome='ok', **fields):
+    """Records a span that was timed by the caller (for code where a with-block doesn't fit)"""
+    record({'chapter': chapter, 'stage': stage, 'start': start, 'outcome': outcome, **fields,
+            'end': time.time(), 'pid': os.getpid()})
+
+
+def load_spans(path):
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    pass # A line cut short by a crash
+    return spans
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def busy_seconds(intervals):
+    """Wall-clock time covered by at least one of the (start, end) intervals"""
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def stage_key(stage):
+    return (STAGE_ORDER.index(stage) if stage in STAGE_ORDER else len(STAGE_ORDER), stage)
+
+
+def report(spans, top=10):
+    """Prints per-stage latency distributions, the slowest chapters and the stage that dominates wall time"""
+    by_stage = {}
+    by_chapter = {}
+    for s in spans:
+        by_stage.setdefault(s['stage'], []).append(s)
+        by_chapter.setdefault(s['chapter'], []).append(s)
+
+    print(f"{len(spans)} spans, {len(by_chapter)} chapters\n")
+    print(f"{'stage':<10}{'count':>7}{'errors':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'sum':>10}{'wall':>10}")
+    wall = {}
+    for stage in sorted(by_stage, key=stage_key):
+        stage_spans = by_stage[stage]
+        durations = sorted(s['end'] - s['start'] for s in stage_spans)
+        errors = sum(1 for s in stage_spans if s.get('outcome') != 'ok')
+        wall[stage] = busy_seconds((s['start'], s['end']) for s in stage_spans)
+        print(f"{stage:<10}{len(durations):>7}{errors:>8}{percentile(durations, 0.5):>8.2f}s{percentile(durations, 0.9):>8.2f}s"
+              f"{percentile(durations, 0.99):>8.2f}s{durations[-1]:>8.2f}s{sum(durations):>9.1f}s{wall[stage]:>9.1f}s")
+
+    # End-to-end time per chapter is the sum of its stages; the slowest show where outliers come from
+    print(f"\nSlowest {top} chapters (sum of stage times):")
+    totals = sorted(by_chapter.items(), key=lambda item: -sum(s['end'] - s['start'] for s in item[1]))
+    for chapter, chapter_spans in totals[:top]:
+        stages = {}
+        for s in chapter_spans:
+            stages[s['stage']] = stages.get(s['stage'], 0.0) + s['end'] - s['start']
+        breakdown = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in sorted(stages.items(), key=lambda item: stage_key(item[0])))
+        print(f"  {chapter}: {sum(stages.values()):.2f}s ({breakdown})")
+
+    # The stages run one after another over the whole novel, so the pipeline's end-to-end
+    # time is the sum of each stage's wall-clock busy time, and the largest one is the critical path
+    total_wall = sum(wall.values())
+    if total_wall > 0:
+        print("\nCritical path (wall-clock time each stage kept busy):")
+        for stage in sorted(wall, key=lambda stage: -wall[stage]):
+            print(f"  {stage:<10}{wall[stage]:>9.1f}s {100 * wall[stage] / total_wall:5.1f}%")
+        dominant = max(wall, key=wall.get)
+        per_chapter = statistics.mean(s['end'] - s['start'] for s in by_stage[dominant])
+        print(f"\n{dominant} dominates end-to-end time ({per_chapter:.2f}s per chapter on average)")
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans):
+    """Span records as an OTLP/JSON ExportTraceServiceRequest (one trace per chapter)"""
+    otlp_spans = []
+    for s in spans:
+        attributes = {key: value for key, value in s.items() if key not in ('start', 'end', 'stage')}
+        otlp_spans.append({
+            'traceId': hashlib.md5(s['chapter'].encode('utf-8')).hexdigest(),
+            'spanId': f"{random.getrandbits(64):016x}",
+            'name': s['stage'],
+            'kind': 1, # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(int(s['start'] * 1e9)),
+            'endTimeUnixNano': str(int(s['end'] * 1e9)),
+            'attributes': [{'key': f"chapter.{key}" if key != 'chapter' else 'chapter.id', 'value': otlp_value(value)}
+                           for key, value in attributes.items()],
+            'status': {'code': 1 if s.get('outcome') == 'ok' else 2},
+        })
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': otlp_spans}],
+    }]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report on or export chapter lifecycle traces')
+    parser.add_argument('--trace', default=TRACE_FILE or DEFAULT_TRACE_FILE, help=f'Trace file (default: {DEFAULT_TRACE_FILE})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report_parser = subparsers.add_parser('report', help='Per-stage latencies, slowest chapters and critical path')
+    report_parser.add_argument('--top', type=int, default=10, help='Slowest chapters to list (default: 10)')
+    report_parser.add_argument('--stage', action='append', help='Only include these stages (repeatable)')
+    export_parser = subparsers.add_parser('export-otlp', help='Convert the trace to OTLP/JSON')
+    export_parser.add_argument('--output', help='Write OTLP/JSON to this file')
+    export_parser.add_argument('--endpoint', help='POST to an OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces')
+    args = parser.parse_args()
+
+    try:
+        spans = load_spans(args.trace)
+    except FileNotFoundError:
+        print(f"No trace file at {args.trace}")
+        return
+    if args.command == 'report':
+        if args.stage:
+            spans = [s for s in spans if s['stage'] in args.stage]
+        if not spans:
+            print("No spans recorded")
+            return
+        report(spans, args.top)
+        return
+
+    payload = to_otlp(spans)
+    if args.output or not args.endpoint:
+        output = args.output or os.path.splitext(args.trace)[0] + '.otlp.json'
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        print(f"Wrote {len(spans)} spans to {output}")
+    if args.endpoint:
+        import requests
+        response = requests.post(args.endpoint, json=payload, timeout=30)
+        response.raise_for_status()
+        print(f"Sent {len(spans)} spans to {args.endpoint}")
+
+
+if __name__ == '__main__':
+    main()
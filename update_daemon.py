@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Polls followed novels for new chapters and downloads them as soon as they appear.
+
+Each poll is one request for the novel page, read for its 'Số chương' count
+(or, if the page has none, one more request for the last page of the chapter
+list). The first poll of a novel only saves its chapter list: following starts
+from there, the chapters already out are left to main.py. Later, only when the
+count went up is the chapter list re-read, starting from the first list page
+that isn't saved yet, and the new chapters downloaded.
+
+Every novel gets its own polling interval, derived from the gaps between the
+releases seen so far: a novel that updates daily is polled a few times a day,
+one that has gone quiet backs off to once a day. Intervals are jittered so
+novels don't end up polled in lockstep.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import time
+import requests
+from bs4 import BeautifulSoup
+from wikidich_scraper import scrape_wikidich_novel, get_chapters_from_page, fetch, save_novel_info
+from chapter_scraper import scrape_all_chapters, get_chapters_dir, chapter_filename
+from proxy_pool import build_pool, EgressError
+from search_index import SearchIndex
+from atomic_io import write_json
+from chapter_catalog import update_novel
+
+FOLLOWED_FILE = 'followed_novels.json'
+STATE_FILE = 'output/poll_state.json'
+DEFAULT_NOVELS = ["https://wikidich.vn/muc-than-ky-convert"]
+
+MIN_INTERVAL = 15 * 60 # Never poll one novel more often than this
+DEFAULT_INTERVAL = 60 * 60 # Until a novel's release cadence is known
+MAX_INTERVAL = 24 * 60 * 60 # Dormant novels are still checked daily
+POLLS_PER_RELEASE = 4 # Aim for this many polls per typical gap between releases
+BACKOFF = 1.5 # Interval multiplier after a poll that found nothing
+DORMANT_AFTER = 3 # A novel is dormant once no release came for this many typical gaps
+JITTER = 0.2 # +/- fraction applied to every interval
+RELEASE_HISTORY = 20 # Release times kept per novel
+MAX_LIST_PAGES = 1000 # scrape_wikidich_novel stops at the real last page before this
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+def load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def save_state(state, path=STATE_FILE):
+    write_json(path, state, indent=2)
+
+
+def parse_count(text):
+    match = re.search(r'\d[\d.,]*', text or '')
+    return int(re.sub(r'[.,]', '', match.group(0))) if match else None
+
+
+def get_chapter_count(url, pool=None):
+    """
+    Current number of chapters of a novel, from as few requests as possible
+
+    Returns:
+        int: Chapter count, or None if it could not be determined
+    """
+    headers = {'User-Agent': USER_AGENT}
+    soup = BeautifulSoup(fetch(url, headers, pool).text, 'html.parser')
+
+    # The metadata block: 'Số chương: 1234'
+    info_text = soup.get_text()
+    if 'Số chương:' in info_text:
+        count = parse_count(info_text.split('Số chương:')[1].split('\n')[0])
+        if count is not None:
+            return count
+
+    # Otherwise the tail of the chapter list: full pages before the last one, plus the last page
+    first_page = get_chapters_from_page(soup)
+    last_link = soup.find('a', string='Cuối', attrs={'onclick': True})
+    match = re.search(r'page\((\d+),(\d+)\)', last_link['onclick']) if last_link else None
+    if not match:
+        return len(first_page) if first_page else None
+    novel_id, last_page = match.groups()
+    response = fetch(f"https://wikidich.vn/get/listchap/{novel_id}?page={last_page}", headers, pool)
+    page_soup = BeautifulSoup(response.json().get('data', ''), 'html.parser')
+    last_chapters = [link for link in page_soup.find_all('a', href=True) if 'Chương' in link.text]
+    return (int(last_page) - 1) * len(first_page) + len(last_chapters)
+
+
+def next_interval(novel_state, found_new, now):
+    """Seconds until the next poll of a novel, before jitter"""
+    releases = novel_state['releases']
+    gaps = [later - earlier for earlier, later in zip(releases, releases[1:])]
+    typical_gap = statistics.median(gaps) if gaps else None
+    base = max(MIN_INTERVAL, min(MAX_INTERVAL, typical_gap / POLLS_PER_RELEASE)) if typical_gap else DEFAULT_INTERVAL
+
+    if found_new:
+        return base
+    interval = novel_state['interval'] * BACKOFF if 'interval' in novel_state else base
+    if typical_gap and now - releases[-1] < DORMANT_AFTER * typical_gap:
+        # A release is still expected soon: don't back off past half the usual gap
+        interval = min(interval, max(base, typical_gap / 2))
+    return max(MIN_INTERVAL, min(MAX_INTERVAL, interval))
+
+
+def update_chapter_list(url, novel_state, output_dir, pool=None):
+    """
+    Re-reads the chapter list and saves it, returns the novel data (None on failure)
+
+    The list is read again only from the last list page the previous poll read, not from page 2.
+    """
+    known_info = None
+    if 'title' in novel_state:
+        known_info = load_json(os.path.join(output_dir, f"{novel_state['title']}_info.json"), None)
+    novel_data = scrape_wikidich_novel(url, follow_pagination=True, max_pages=MAX_LIST_PAGES, pool=pool,
+                                       known_info=known_info)
+    if not novel_data or not novel_data.get('chapters'):
+        return None
+    novel_state['title'] = save_novel_info(novel_data, output_dir)
+    return novel_data
+
+
+def download_new_chapters(url, novel_state, output_dir, pool=None, search_index=None, jobs=1, catalog=False):
+    """
+    Updates the chapter list and downloads the chapters released since the novel was followed, returns how many
+
+    Chapters listed at the first poll (novel_state['baseline']) are not downloaded; later ones
+    that have no file yet are, including any a previous poll failed to download.
+    """
+    novel_data = update_chapter_list(url, novel_state, output_dir, pool)
+    if novel_data is None:
+        return 0
+    title = novel_state['title']
+
+    chapters_dir = get_chapters_dir(novel_data, output_dir)
+    missing = [chapter for index, chapter in enumerate(novel_data['chapters'])
+               if index >= novel_state.get('baseline', 0)
+               and not os.path.exists(os.path.join(chapters_dir, chapter_filename(index)))]
+    if missing:
+        scrape_all_chapters(novel_data, specific_chapters=missing, output_dir=output_dir, delay=1.0,
+                            search_index=search_index, pool=pool, jobs=jobs)
+    if catalog:
+        try:
+            update_novel(title, output_dir)
+        except RuntimeError as e:
+            print(f"  Catalogue not updated: {e}")
+    return len(missing)
+
+
+def poll(url, novel_state, output_dir, pool=None, search_index=None, jobs=1, catalog=False):
+    """Checks one novel and downloads new chapters; updates novel_state in place"""
+    now = time.time()
+    found_new = False
+    try:
+        count = get_chapter_count(url, pool)
+    except (requests.exceptions.RequestException, EgressError, ValueError) as e:
+        print(f"  Could not check {url}: {e}")
+        count = None
+
+    if count is not None:
+        last_count = novel_state.get('count')
+        if last_count is None:
+            # The first poll of a novel only establishes its count and chapter list, it is not a release
+            print(f"  {url}: {count} chapters, following new chapters from here")
+            novel_data = update_chapter_list(url, novel_state, output_dir, pool)
+            novel_state['baseline'] = len(novel_data['chapters']) if novel_data else count
+        elif count > last_count:
+            print(f"  {url}: {count} chapters (was {last_count}), downloading new chapters")
+            downloaded = download_new_chapters(url, novel_state, output_dir, pool, search_index, jobs, catalog)
+            print(f"  Downloaded {downloaded} new chapters")
+            found_new = True
+            novel_state['releases'] = (novel_state['releases'] + [now])[-RELEASE_HISTORY:]
+        else:
+            print(f"  {url}: no new chapters ({count})")
+        novel_state['count'] = count
+
+    interval = next_interval(novel_state, found_new, now)
+    novel_state['interval'] = interval
+    novel_state['last_check'] = now
+    novel_state['next_check'] = now + interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def run(novels, output_dir='output', state_path=STATE_FILE, pool=None, search_index=None, jobs=1, once=False, catalog=False):
+    """
+    Polls novels until interrupted, always sleeping until the next novel is due
+
+    With once=True, every novel that is due now is polled and the function returns.
+    """
+    state = load_json(state_path, {})
+    for url in novels:
+        state.setdefault(url, {'releases': [], 'next_check': 0})
+
+    while True:
+        due = sorted((novel_state['next_check'], url) for url, novel_state in state.items() if url in novels)
+        if not due:
+            return
+        next_check, url = due[0]
+        wait = next_check - time.time()
+        if wait > 0:
+            if once:
+                return
+            print(f"Next poll in {wait / 60:.0f} min: {url}")
+            time.sleep(wait)
+
+        poll(url, state[url], output_dir, pool, search_index, jobs, catalog)
+        print(f"  Next check of {url} in {(state[url]['next_check'] - time.time()) / 60:.0f} min")
+        save_state(state, state_path)
+        if search_index is not None:
+            search_index.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Poll followed novels for new chapters and download them')
+    parser.add_argument('novels', nargs='*', help=f'Novel URLs (default: the list in {FOLLOWED_FILE})')
+    parser.add_argument('--once', action='store_true', help='Poll the novels that are due now and exit (e.g. from cron)')
+    parser.add_argument('--output', default='output', help='Output directory')
+    parser.add_argument('--state', default=STATE_FILE, help=f'Polling state file (default: {STATE_FILE})')
+    parser.add_argument('--proxies', metavar='FILE', help='Fetch through the exits listed in FILE (see proxy_pool.py)')
+    parser.add_argument('--jobs', type=int, default=None, help='Chapters fetched concurrently with --proxies (default: 2 per exit)')
+    parser.add_argument('--catalog', action='store_true', help='Update the chapter catalogue (needs pyarrow) after each download')
+    parser.add_argument('--no-index', action='store_true', help='Do not add downloaded chapters to the full-text search index')
+    args = parser.parse_args()
+
+    novels = args.novels or load_json(FOLLOWED_FILE, DEFAULT_NOVELS)
+    pool = build_pool(args.proxies) if args.proxies else None
+    jobs = args.jobs or (2 * len(pool) if pool else 1)
+    search_index = None if args.no_index else SearchIndex()
+    print(f"Following {len(novels)} novels")
+    try:
+        run(novels, args.output, args.state, pool, search_index, jobs, args.once, args.catalog)
+    except KeyboardInterrupt:
+        print("\nStopped")
+    finally:
+        if search_index is not None:
+            search_index.close()
+
+
+if __name__ == '__main__':
+    main()
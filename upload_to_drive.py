@@ -1,16 +1,30 @@
+import argparse
 import os
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 import pickle
+from chapter_bundles import BUNDLE_FORMATS, DEFAULT_BUNDLE_SIZE, build_bundles
+from chapter_pack import PACK_SUFFIX
+from drive_sync import (DEFAULT_MANIFEST, DEFAULT_WORKERS, DriveBackend, LocalBackend,
+                        ensure_folder_path, load_manifest, save_manifest, sync_files)
+from tracing import span, chapter_id
+
+# The Google API client libraries are slow to import, so they are imported
+# inside the functions that use them rather than at module load.
 
 # If modifying these scopes, delete the file token.pickle.
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+MAIN_FOLDER_NAME = 'Mục Thần Ký'
+NOVEL_TITLE = 'mục_thần_ký'
+TXT_DIR = 'output/mục_thần_ký_txt'
+TXT_PACK = TXT_DIR + PACK_SUFFIX
+JSON_DIR = 'output'
+BUNDLE_DIR = 'output/mục_thần_ký_bundles'
+
 def get_credentials():
     """Gets valid user credentials from storage or creates new ones."""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+    
     creds = None
     # The file token.pickle stores the user's access and refresh tokens
     if os.path.exists('token.pickle'):
@@ -45,6 +59,8 @@ def create_folder(service, folder_name, parent_id=None):
 
 def upload_file(service, file_path, folder_id=None):
     """Uploads a file to Google Drive."""
+    from googleapiclient.http import MediaFileUpload
+    
     file_name = os.path.basename(file_path)
     file_metadata = {'name': file_name}
     if folder_id:
@@ -56,13 +72,71 @@ def upload_file(service, file_path, folder_id=None):
                                 fields='id').execute()
     return file.get('id')
 
+def list_files(directory, suffix):
+    """Lists files in a directory with the given suffix, sorted by name."""
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(suffix))
+
+def txt_files_to_upload(from_pack=False):
+    """The chapter txt files, or the txt pack as a single file"""
+    return [TXT_PACK] if from_pack else list_files(TXT_DIR, '.txt')
+
+def sync(backend, manifest_path, workers, bundle_size=None, bundle_format='zip', from_pack=False):
+    """
+    Incrementally syncs txt and JSON files, reusing folders and skipping unchanged files.
+    
+    With `bundle_size`, chapters are packed into archives of that many chapters and
+    only the archives containing changed chapters are uploaded. With `from_pack`, the
+    chapters are read from the txt pack (see chapter_pack.py) instead of TXT_DIR.
+    """
+    manifest = load_manifest(manifest_path)
+    if bundle_size:
+        txt_folder_id = ensure_folder_path(backend, manifest, f'{MAIN_FOLDER_NAME}/bundles')
+        txt_files = build_bundles(TXT_PACK if from_pack else TXT_DIR, BUNDLE_DIR, bundle_size, bundle_format)
+    else:
+        txt_folder_id = ensure_folder_path(backend, manifest, f'{MAIN_FOLDER_NAME}/txt_files')
+        txt_files = txt_files_to_upload(from_pack)
+    json_folder_id = ensure_folder_path(backend, manifest, f'{MAIN_FOLDER_NAME}/json_files')
+    save_manifest(manifest, manifest_path)
+    
+    totals = [0, 0, 0]
+    for file_paths, folder_id in [(txt_files, txt_folder_id),
+                                  (list_files(JSON_DIR, '.json'), json_folder_id)]:
+        counts = sync_files(backend, manifest, file_paths, folder_id, workers=workers, manifest_path=manifest_path,
+                            novel=NOVEL_TITLE)
+        totals = [total + count for total, count in zip(totals, counts)]
+    
+    print(f'Sync complete! Uploaded {totals[0]}, unchanged {totals[1]}, failed {totals[2]}.')
+
 def main():
+    parser = argparse.ArgumentParser(description='Upload novel files to Google Drive')
+    parser.add_argument('--sync', action='store_true', help='Incremental sync: reuse folders and upload only new or changed files, concurrently')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'Concurrent uploads in --sync mode (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--manifest', help=f'Sync manifest path (default: {DEFAULT_MANIFEST}, or inside --local-target)')
+    parser.add_argument('--bundle', type=int, nargs='?', const=DEFAULT_BUNDLE_SIZE, metavar='N',
+                        help=f'Sync chapters as compressed archives of N chapters (default N: {DEFAULT_BUNDLE_SIZE}); implies --sync')
+    parser.add_argument('--bundle-format', choices=BUNDLE_FORMATS, default='zip', help='Archive format for --bundle (default: zip)')
+    parser.add_argument('--local-target', help='Sync into this local directory instead of Google Drive (for testing)')
+    parser.add_argument('--from-pack', action='store_true', help=f'Read chapters from {TXT_PACK} instead of {TXT_DIR} (uploaded as one file unless --bundle)')
+    args = parser.parse_args()
+    if args.bundle is not None and args.bundle <= 0:
+        parser.error('--bundle must be a positive integer.')
+    
+    if args.local_target:
+        manifest_path = args.manifest or os.path.join(args.local_target, DEFAULT_MANIFEST)
+        sync(LocalBackend(args.local_target), manifest_path, args.workers, args.bundle, args.bundle_format, args.from_pack)
+        return
+    if args.sync or args.bundle:
+        sync(DriveBackend(get_credentials()), args.manifest or DEFAULT_MANIFEST, args.workers, args.bundle, args.bundle_format, args.from_pack)
+        return
+    
+    from googleapiclient.discovery import build
+    
     # Get credentials
     creds = get_credentials()
     service = build('drive', 'v3', credentials=creds)
     
     # Create main folder for the novel
-    main_folder_name = 'Mục Thần Ký'
+    main_folder_name = MAIN_FOLDER_NAME
     main_folder_id = create_folder(service, main_folder_name)
     
     # Create subfolders
@@ -70,20 +144,20 @@ def main():
     json_folder_id = create_folder(service, 'json_files', main_folder_id)
     
     # Upload TXT files
-    txt_dir = 'output/mục_thần_ký_txt'
-    for filename in os.listdir(txt_dir):
-        if filename.endswith('.txt'):
-            file_path = os.path.join(txt_dir, filename)
-            print(f'Uploading {filename}...')
+    for file_path in txt_files_to_upload(args.from_pack):
+        filename = os.path.basename(file_path)
+        print(f'Uploading {filename}...')
+        with span('upload', chapter_id(NOVEL_TITLE, filename), bytes=os.path.getsize(file_path)):
             upload_file(service, file_path, txt_folder_id)
     
     # Upload JSON files
-    json_dir = 'output'
+    json_dir = JSON_DIR
     for filename in os.listdir(json_dir):
         if filename.endswith('.json'):
             file_path = os.path.join(json_dir, filename)
             print(f'Uploading {filename}...')
-            upload_file(service, file_path, json_folder_id)
+            with span('upload', chapter_id(NOVEL_TITLE, filename), bytes=os.path.getsize(file_path)):
+                upload_file(service, file_path, json_folder_id)
     
     print('Upload complete!')
 
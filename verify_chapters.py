@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from chapter_scraper import scrape_chapter_content, get_chapters_dir, chapter_filename, novel_slug
+from tracing import chapter_id
+from proxy_pool import build_pool
+from atomic_io import atomic_write, file_stamp, CompletionJournal
+
+# Problems that can be fixed by re-fetching the chapter page ('not downloaded' is not a problem to repair)
+REPAIRABLE = ('missing', 'unreadable', 'empty', 'fallback')
+
+def chapter_number(title):
+    """Chapter number from a 'Chương N: ...' title, or None"""
+    match = re.search(r'[Cc]hương\s+(\d+)', title or '')
+    return int(match.group(1)) if match else None
+
+def extraction_method(chapter_data):
+    """How a stored chapter's content was extracted ('container', 'fallback' or 'none')"""
+    if 'extraction' in chapter_data:
+        return chapter_data['extraction']
+    # Chapters saved before the 'extraction' field existed: the fallback wraps plain text
+    # in a bare <div>, while container extraction always comes from prettify()
+    html = chapter_data.get('content_html', '')
+    if not html:
+        return 'none'
+    return 'fallback' if html.startswith('<div>') else 'container'
+
+def find_numbering_gaps(chapters):
+    """Chapter numbers missing between the lowest and highest 'Chương N' in the chapter list"""
+    numbers = sorted({n for n in (chapter_number(ch.get('title')) for ch in chapters) if n is not None})
+    if not numbers:
+        return []
+    present = set(numbers)
+    return [n for n in range(numbers[0], numbers[-1] + 1) if n not in present]
+
+def verify_chapters(novel_data, output_dir="output"):
+    """
+    Compare the chapter list against stored chapter files
+
+    Args:
+        novel_data (dict): Novel information with chapters
+        output_dir (str): Directory holding the novel's chapter directory
+
+    Returns:
+        tuple: (list of issue dicts with index/title/url/problem, list of missing chapter numbers)
+    """
+    chapters_dir = get_chapters_dir(novel_data, output_dir)
+    issues = []
+
+    # A chapter without a file is only missing if it should have been downloaded: it lies within
+    # the downloaded range or was journaled as complete. Beyond that range it simply hasn't been
+    # scraped yet (e.g. after main.py --chapters 3), and --repair must not download the rest of the novel.
+    existing = set(os.listdir(chapters_dir)) if os.path.isdir(chapters_dir) else set()
+    downloaded = [index for index in range(len(novel_data.get('chapters', []))) if chapter_filename(index) in existing]
+    last_downloaded = downloaded[-1] if downloaded else -1
+    journal = CompletionJournal(chapters_dir)
+
+    for index, chapter in enumerate(novel_data.get('chapters', [])):
+        filename = chapter_filename(index)
+        path = os.path.join(chapters_dir, filename)
+        problem = None
+        if filename not in existing:
+            problem = 'missing' if index < last_downloaded or filename in journal.entries else 'not downloaded'
+        else:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    chapter_data = json.load(f)
+            except (OSError, ValueError):
+                problem = 'unreadable'
+            else:
+                if not chapter_data.get('content_text', '').strip():
+                    problem = 'empty'
+                elif extraction_method(chapter_data) == 'fallback':
+                    problem = 'fallback'
+
+        if problem:
+            issues.append({'index': index, 'title': chapter.get('title'), 'url': chapter['url'], 'problem': problem})
+
+    return issues, find_numbering_gaps(novel_data.get('chapters', []))
+
+def repair_chapters(novel_data, issues, output_dir="output", workers=4, pool=None):
+    """
+    Re-fetch only the chapters with repairable issues, concurrently
+
+    A re-fetched chapter replaces the stored one unless it is still a fallback
+    extraction and a stored version already exists. If an egress pool is given,
+    re-fetches go through it.
+
+    Returns:
+        int: Number of chapters repaired
+    """
+    chapters_dir = get_chapters_dir(novel_data, output_dir)
+    os.makedirs(chapters_dir, exist_ok=True)
+    to_repair = [issue for issue in issues if issue['problem'] in REPAIRABLE]
+    print(f"Repairing {len(to_repair)} chapters with {workers} workers")
+
+    repaired = 0
+    journal = CompletionJournal(chapters_dir)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for issue in to_repair:
+            trace_id = chapter_id(novel_slug(novel_data), chapter_filename(issue['index']))
+            futures[executor.submit(scrape_chapter_content, issue['url'], pool=pool, chapter=trace_id)] = issue
+        for future in as_completed(futures):
+            issue = futures[future]
+            filename = chapter_filename(issue['index'])
+            try:
+                chapter_data = future.result()
+            except Exception as e:
+                print(f"  Failed to re-fetch {filename}: {e}")
+                continue
+            if not chapter_data or not chapter_data.get('content_text'):
+                print(f"  Still no content for {filename}")
+                continue
+            if chapter_data.get('extraction') == 'fallback' and issue['problem'] == 'fallback':
+                print(f"  {filename} still needs the fallback extraction, keeping stored version")
+                continue
+
+            full_chapter_data = {**novel_data['chapters'][issue['index']], **chapter_data}
+            chapter_path = os.path.join(chapters_dir, filename)
+            with atomic_write(chapter_path) as f:
+                json.dump(full_chapter_data, f, ensure_ascii=False, indent=4)
+            journal.record(filename, file_stamp(chapter_path))
+            repaired += 1
+            print(f"  Repaired {filename} ({issue['problem']})")
+
+    journal.close()
+    return repaired
+
+def print_report(issues, gaps):
+    counts = {}
+    for issue in issues:
+        counts[issue['problem']] = counts.get(issue['problem'], 0) + 1
+        if issue['problem'] != 'not downloaded':
+            print(f"  {chapter_filename(issue['index'])}: {issue['problem']} - {issue['title']}")
+    not_downloaded = [issue['index'] for issue in issues if issue['problem'] == 'not downloaded']
+    if not_downloaded:
+        print(f"  Not downloaded yet: {chapter_filename(not_downloaded[0])} to {chapter_filename(not_downloaded[-1])} ({len(not_downloaded)} chapters)")
+    if gaps:
+        print(f"  Numbering gaps in chapter list: {', '.join(map(str, gaps))}")
+    summary = ', '.join(f"{problem}: {count}" for problem, count in sorted(counts.items())) or 'none'
+    print(f"Issues found: {summary}; numbering gaps: {len(gaps)}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify stored chapters and re-fetch missing or failed ones')
+    parser.add_argument('--novel', default='mục_thần_ký', help='Novel title as used in output file names')
+    parser.add_argument('--output', default='output', help='Output directory')
+    parser.add_argument('--repair', action='store_true', help='Re-fetch chapters that are missing, empty or used the fallback extraction')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent re-fetches for --repair')
+    parser.add_argument('--proxies', metavar='FILE', help='Re-fetch through the exits listed in FILE (see proxy_pool.py)')
+    args = parser.parse_args()
+
+    # Uses the saved chapter list, so verifying costs no requests at all
+    info_path = os.path.join(args.output, f"{args.novel}_info.json")
+    try:
+        with open(info_path, 'r', encoding='utf-8') as f:
+            novel_data = json.load(f)
+    except FileNotFoundError:
+        print(f"Novel data file not found: {info_path}. Please run main.py --info-only first.")
+        return
+
+    issues, gaps = verify_chapters(novel_data, args.output)
+    print_report(issues, gaps)
+
+    repairable = [issue for issue in issues if issue['problem'] in REPAIRABLE]
+    if args.repair and repairable:
+        pool = build_pool(args.proxies) if args.proxies else None
+        repaired = repair_chapters(novel_data, repairable, args.output, args.workers, pool)
+        print(f"Repaired {repaired}/{len(repairable)} chapters")
+
+if __name__ == "__main__":
+    main()
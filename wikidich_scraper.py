@@ -1,13 +1,32 @@
 import requests
 from bs4 import BeautifulSoup
-import pandas as pd
-import json
+import csv
 import os
 import time
 import re
 from urllib.parse import urljoin, urlparse, parse_qs
+from proxy_pool import EgressError
+from site_profiles import site_of, extract
+from fetch_cache import page_cache, normalize_url
+from atomic_io import atomic_write, write_json
+from chapter_titles import build_title_index, save_title_index
+from chapter_scraper import novel_slug
 
-def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20):
+def fetch(url, headers, pool=None):
+    """GET a page directly, or through an egress pool if one is given (at most once per URL per run, see fetch_cache)"""
+    def get(url):
+        if pool is not None:
+            return pool.get(url, headers=headers)
+        response = requests.get(url, headers=headers)
+        response.raise_for_status()  # Raise exception for HTTP errors
+        return response
+    return page_cache.get(url, get)
+
+def slug_from_url(url):
+    """Last path segment of a novel URL, e.g. 'muc-than-ky-convert'"""
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1] or 'unknown'
+
+def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20, pool=None, known_info=None):
     """
     Scrape novel information and chapters from wikidich.vn
     
@@ -15,6 +34,9 @@ def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20):
         url (str): URL of the novel page
         follow_pagination (bool): Whether to follow pagination links to get all chapters
         max_pages (int): Maximum number of pages to scrape
+        pool (EgressPool): Fetch through this egress pool instead of directly
+        known_info (dict): Novel information saved by an earlier scrape; its chapter list is
+            extended from the last list page that scrape read instead of read again from page 2
         
     Returns:
         dict: Novel information and chapters
@@ -25,12 +47,11 @@ def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20):
     }
     
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raise exception for HTTP errors
+        response = fetch(url, headers, pool)
         
         # For debugging
         print(f"Status code: {response.status_code}")
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, EgressError) as e:
         print(f"Error fetching the page: {e}")
         return None
     
@@ -40,17 +61,17 @@ def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20):
     # Extract novel information
     novel_info = {}
     
-    # Title - looking for the title which could be in h1 or h2
+    # Title - looking for the title which could be in h1 or h2. Output files are named
+    # after it, so every novel needs its own: without a heading, fall back to the URL
     title_element = soup.find('h1', class_='post-title') or soup.find('h1') or soup.find('h2')
-    if title_element and 'Mục Thần Ký' in title_element.text:
-        novel_info['title'] = title_element.text.strip()
-    else:
+    heading = title_element.text.strip() if title_element else ''
+    if 'Mục Thần Ký' in heading:
+        novel_info['title'] = heading
+    elif slug_from_url(url).startswith('muc-than-ky') and soup.find(string=lambda text: text and 'Mục Thần Ký' in text):
         # Try to find it directly from the content based on the example
-        title_match = soup.find(string=lambda text: text and 'Mục Thần Ký' in text)
-        if title_match:
-            novel_info['title'] = 'Mục Thần Ký'
-        else:
-            novel_info['title'] = "Unknown"
+        novel_info['title'] = 'Mục Thần Ký'
+    else:
+        novel_info['title'] = heading or slug_from_url(url)
     
     # Author, genre, status, chapters, views - adjust selector based on content
     info_text = soup.get_text()
@@ -87,24 +108,35 @@ def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20):
             print(f"Found novel ID: {novel_id}")
     
     # Start with the chapters from the first page (using HTML parsing)
-    chapters = get_chapters_from_page(soup)
+    chapters = get_chapters_from_page(soup, site_of(url))
     print(f"Found {len(chapters)} chapters on page 1 (HTML parsing)")
     
+    # A saved list records the last API page it was read up to ('list_last_page'). That page
+    # may have filled up since, so it is read again; the dedup below drops what was already known.
+    # Page sizes aren't assumed anywhere: the page-1 HTML parse may find more or fewer links.
+    first_page = 2
+    last_page = 1
+    if known_info and known_info.get('list_last_page') and known_info.get('chapters'):
+        last_page = known_info['list_last_page']
+        first_page = max(2, last_page)
+        chapters = known_info['chapters'] + chapters
+        print(f"{len(known_info['chapters'])} chapters already known, reading the list from page {first_page}")
+    
     if novel_id and follow_pagination:
         # Use the direct API endpoint to get chapters from remaining pages
-        for current_page in range(2, max_pages + 1):
+        for current_page in range(first_page, max_pages + 1):
             print(f"Fetching chapter list from API for page {current_page}")
             
             # Construct the API URL
             api_url = f"https://wikidich.vn/get/listchap/{novel_id}?page={current_page}"
             
-            # Add a delay to avoid rate limiting
-            time.sleep(1)
+            # Add a delay to avoid rate limiting (the pool spaces its own requests)
+            if pool is None:
+                time.sleep(1)
             
             try:
                 # Fetch the data from the API
-                response = requests.get(api_url, headers=headers)
-                response.raise_for_status()
+                response = fetch(api_url, headers, pool)
                 
                 # Parse the JSON response
                 json_data = response.json()
@@ -134,6 +166,7 @@ def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20):
                     if page_chapters:
                         chapters.extend(page_chapters)
                         print(f"Added {len(page_chapters)} chapters from page {current_page}")
+                        last_page = current_page
                     else:
                         print(f"No chapters found on page {current_page}, stopping pagination")
                         break
@@ -159,15 +192,19 @@ def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20):
                 print(f"Response content: {response.text[:200]}")
                 break
     
-    # Remove any duplicates by URL
+    # Remove any duplicates by URL (relative and absolute links to the same chapter count as one)
     unique_chapters = []
     seen_urls = set()
     for chapter in chapters:
-        if chapter['url'] not in seen_urls and not chapter['url'].startswith('javascript'):
+        if chapter['url'].startswith('javascript'):
+            continue
+        key = normalize_url(chapter['url'])
+        if key not in seen_urls:
             unique_chapters.append(chapter)
-            seen_urls.add(chapter['url'])
+            seen_urls.add(key)
     
     novel_info['chapters'] = unique_chapters
+    novel_info['list_last_page'] = last_page
     
     # Print debug info
     print(f"Found title: {novel_info['title']}")
@@ -175,25 +212,20 @@ def scrape_wikidich_novel(url, follow_pagination=True, max_pages=20):
     
     return novel_info
 
-def get_chapters_from_page(soup):
-    """Extract chapter links from a page"""
-    chapters = []
+def get_chapters_from_page(soup, site='wikidich.vn'):
+    """Extract chapter links from a page, using the site's chapter list container when it has one"""
+    def read_links(container):
+        links = [{'title': link.text.strip(), 'url': link['href']}
+                 for link in container.find_all('a', href=True) if link.text and link.text.strip()]
+        return links or None
     
-    # Look specifically for the element with ID "chapter-list"
-    chapter_list = soup.find(id='chapter-list')
+    selector, chapters = extract(soup, site, 'chapter_list', read_links)
     
-    if chapter_list:
-        print("Found #chapter-list container!")
-        # Extract all links in the chapter list
-        chapter_links = chapter_list.find_all('a', href=True)
-        for link in chapter_links:
-            if link.text and len(link.text.strip()) > 0:
-                chapters.append({
-                    'title': link.text.strip(),
-                    'url': link['href']
-                })
+    if chapters:
+        print(f"Found {selector} container!")
     else:
-        print("No #chapter-list container found, trying alternative methods...")
+        chapters = []
+        print("No chapter list container found, trying alternative methods...")
         
         # Try to find chapter links in potential chapter list containers
         chapter_containers = soup.find_all(['ul', 'div'], class_=lambda c: c and ('list-chapter' in c or 'chapter' in c or 'list' in c))
@@ -247,10 +279,19 @@ def get_chapters_from_page(soup):
     return [ch for ch in chapters if ch['title'].strip().startswith(('Chương', 'chương', 'Chapter')) 
             and not ch['url'].startswith('javascript')]
 
+def save_novel_info(novel_data, output_dir='output'):
+    """Saves the novel info JSON, chapter CSV and title index, returns the novel's file name prefix"""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    title = novel_slug(novel_data)
+    save_to_json(novel_data, os.path.join(output_dir, f"{title}_info.json"))
+    save_to_csv(novel_data, os.path.join(output_dir, f"{title}_chapters.csv"))
+    save_title_index(build_title_index(novel_data['chapters']), output_dir, title)
+    return title
+
 def save_to_json(data, filename):
     """Save data to JSON file"""
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    write_json(filename, data)
     print(f"Data saved to {filename}")
 
 def save_to_csv(data, filename):
@@ -259,8 +300,17 @@ def save_to_csv(data, filename):
         print("No chapter data to save")
         return
         
-    df = pd.DataFrame(data['chapters'])
-    df.to_csv(filename, index=False, encoding='utf-8')
+    # Columns in order of first appearance, like a DataFrame built from the chapter dicts
+    fieldnames = []
+    for chapter in data['chapters']:
+        for key in chapter:
+            if key not in fieldnames:
+                fieldnames.append(key)
+    
+    with atomic_write(filename, newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval='')
+        writer.writeheader()
+        writer.writerows(data['chapters'])
     print(f"Chapters saved to {filename}")
 
 if __name__ == "__main__":